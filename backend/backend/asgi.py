@@ -3,6 +3,10 @@ ASGI config for backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The room push channel (``room/<room_code>/events/``, Server-Sent Events) is a
+long-lived streaming response and must be served through this entry point,
+e.g. ``uvicorn backend.asgi:application``.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -12,5 +16,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+# settings 依此關閉持久連線（settings.ASGI_DEPLOYMENT）
+os.environ.setdefault('DJANGO_ASGI', '1')
 
 application = get_asgi_application()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,7 +43,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'game.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'game.sharding.RoomShardMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,12 +77,56 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+#
+# 以環境變數 DB_PROFILE 選擇資料庫設定（比較方式見 manage.py bench_db --compare）：
+#   sqlite      預設 rollback journal、每個請求重新連線
+#   sqlite-wal  WAL + synchronous=NORMAL，讀取不會被心跳寫回擋住，WSGI 下並保留連線（預設）
+#   postgres    PostgreSQL + psycopg 連線池（需安裝 psycopg[pool]）
+
+DB_PROFILE = os.environ.get('DB_PROFILE', 'sqlite-wal')
+
+# 以 backend/asgi.py 啟動時為 True（推播與 ASYNC_VIEWS 都需要 ASGI）；
+# ASGI 下同一個連線不會固定在某個執行緒上重用，Django 建議關閉持久連線（CONN_MAX_AGE=0）
+ASGI_DEPLOYMENT = os.environ.get('DJANGO_ASGI') == '1'
+
+_SQLITE_OPTIONS = {
+    # 交易一開始就取得寫入鎖，join_room 的人數檢查才不會被同時加入的人超過
+    'transaction_mode': 'IMMEDIATE',
+    # busy_timeout：等待寫入鎖的秒數
+    'timeout': 20,
+}
 
-DATABASES = {
-    'default': {
+DATABASE_PROFILES = {
+    'sqlite': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+        'OPTIONS': _SQLITE_OPTIONS,
+    },
+    'sqlite-wal': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+        'OPTIONS': {
+            **_SQLITE_OPTIONS,
+            'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+        },
+        'CONN_MAX_AGE': 0 if ASGI_DEPLOYMENT else 60,
+        'CONN_HEALTH_CHECKS': True,
+    },
+    'postgres': {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('DB_NAME', 'castle'),
+        'USER': os.environ.get('DB_USER', 'castle'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+        'HOST': os.environ.get('DB_HOST', 'localhost'),
+        'PORT': os.environ.get('DB_PORT', '5432'),
+        'OPTIONS': {
+            'pool': {'min_size': 2, 'max_size': 20},
+        },
+    },
+}
+
+DATABASES = {
+    'default': DATABASE_PROFILES[DB_PROFILE],
 }
 
 
@@ -127,3 +174,87 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 CORS_ALLOW_ALL_ORIGINS = True
 
 ADMIN_PASSWORD = "1234"
+
+# 回合截止排程器（game/scheduler.py）
+TURN_SCHEDULER_ENABLED = True
+TURN_SCHEDULER_RESYNC_SECONDS = 30
+
+# 玩家在線狀態（game/presence.py），多個 worker 時改用 CachePresenceStore
+PRESENCE_STORE = {
+    'BACKEND': 'game.presence.LocalPresenceStore',
+    'TTL_SECONDS': 120,
+    'FLUSH_SECONDS': 20,
+}
+
+# 離線玩家清除（game/reaper.py，也可用 manage.py reap_inactive_players）
+INACTIVE_REAPER_ENABLED = True
+INACTIVE_REAPER_INTERVAL_SECONDS = 10
+INACTIVE_PLAYER_TIMEOUT_SECONDS = 60
+
+# /rooms/ 大廳列表快取（game/lobby.py），多個 worker 時改用 CacheLobbyDirectory
+# RELOAD_SECONDS：LocalLobbyDirectory 多久從資料庫整份重建一次，才看得到其他 worker 的變動
+# （改用 CacheLobbyDirectory 時拿掉，它以 TIMEOUT 控制）
+LOBBY_DIRECTORY = {
+    'BACKEND': 'game.lobby.LocalLobbyDirectory',
+    'RELOAD_SECONDS': 5,
+}
+
+# 記憶體中的房間狀態（game/engine.py），get_players 直接由記憶體回應
+# REVALIDATE_SECONDS：多久向資料庫比對一次 version（只有單一行程或依房間分流時可設為 None）
+# PERSIST_SECONDS：多久把記憶體中的心跳寫回資料庫
+GAME_ENGINE = {
+    'ENABLED': True,
+    'REVALIDATE_SECONDS': 1,
+    'PERSIST_SECONDS': 5,
+}
+
+# 依 room_code 分流到固定的 worker / 節點（game/sharding.py）
+# ROOM_SHARDS：所有節點的網址（逗號分隔）；ROOM_SHARD_SELF：本節點的網址，未設定則不分流
+ROOM_SHARDS = [url for url in os.environ.get('ROOM_SHARDS', '').split(',') if url]
+ROOM_SHARD_SELF = os.environ.get('ROOM_SHARD_SELF', '')
+
+# get_players / heartbeat / rooms 改用 game/async_views.py（需以 ASGI 部署）
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS') == '1'
+
+# 每個 API 的延遲 / 查詢數 / 資料庫時間（game/metrics.py），由 /metrics/ 輸出
+# SLOW_REQUEST_MS：超過此時間的請求連同 SQL 記到 game.metrics logger，None 表示不記錄
+# /metrics/ 只允許帶 Authorization: Bearer <TOKEN>（環境變數 METRICS_TOKEN）或來自 ALLOWED_IPS
+# （環境變數 METRICS_ALLOWED_IPS，逗號分隔）的請求；兩者都沒設定時一律拒絕。
+# 預設不放行本機：反向代理在同一台機器上時，所有外部請求的 REMOTE_ADDR 都是 127.0.0.1
+METRICS = {
+    'ENABLED': True,
+    'SLOW_REQUEST_MS': None,
+    'ALLOWED_IPS': [ip for ip in os.environ.get('METRICS_ALLOWED_IPS', '').split(',') if ip],
+    'TOKEN': os.environ.get('METRICS_TOKEN', ''),
+}
+
+# get_players 回傳的 next_poll_ms（game/state.py）：遊戲中依回合剩餘時間在 MIN_MS～GAME_MS 之間，
+# 大廳為 LOBBY_MS；同時處理的請求超過 BUSY_IN_FLIGHT 時依比例拉長，最多 MAX_MS
+# （大廳輪詢兼心跳，離線判定 state.IDLE_SECONDS = 2 × MAX_MS + 2 秒，調大 MAX_MS 玩家會較晚顯示離線）
+POLL_HINTS = {
+    'MIN_MS': 500,
+    'GAME_MS': 2000,
+    'LOBBY_MS': 2500,
+    'MAX_MS': 3000,
+    'BUSY_IN_FLIGHT': 50,
+}
+
+# 房間變動 journal（game.models.RoomEvent，/room/<code>/journal/?since=N）
+# manage.py compact_room_events 只保留每間房最新 KEEP_EVENTS 筆且不超過 KEEP_SECONDS 秒的事件
+ROOM_JOURNAL = {
+    'PAGE_SIZE': 200,
+    'KEEP_EVENTS': 500,
+    'KEEP_SECONDS': 3600,
+}
+
+# 伺服器分配的房間代碼（game/codes.py）：不含 0/O、1/I/L 等易混淆字元，LENGTH 碼
+ROOM_CODES = {
+    'ALPHABET': '23456789ABCDEFGHJKMNPQRSTUVWXYZ',
+    'LENGTH': 4,
+}
+
+# quick_join 的候選房間（game/matchmaking.py）：其他 worker 的變動不會通知本行程，
+# 每 RELOAD_SECONDS 從資料庫重建一次（None 表示只在第一次使用時載入，僅適用單一行程）
+MATCHMAKING = {
+    'RELOAD_SECONDS': 5,
+}
@@ -1,19 +1,32 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
-from game import views
+from game import views, async_views
+
+# 輪詢最頻繁的 API 在 ASGI 下可改用非同步版本（ASYNC_VIEWS=1）
+hot_views = async_views if settings.ASYNC_VIEWS else views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('join/', views.join_room),
-    path('room/<str:room_code>/players/', views.get_players),
+    path('quick_join/', views.quick_join),
+    path('room/<str:room_code>/players/', hot_views.get_players),
+    path('room/<str:room_code>/events/', views.room_events),
+    path('room/<str:room_code>/sync/', hot_views.room_sync),
+    path('room/<str:room_code>/journal/', views.room_journal),
     path('leave/', views.leave_room),
     path('start/', views.start_game),
-    path('rooms/', views.list_rooms),
+    path('next_turn/', views.next_turn),
+    path('rooms/', hot_views.list_rooms),
+    path('rooms/state/', views.rooms_state),
     path('admin_delete_room/', views.admin_delete_room),
     path('kick_player/', views.kick_player),
     path('transfer_owner/', views.transfer_owner),
     path('admin_delete_all_rooms/', views.admin_delete_all_rooms),
+    path('admin_purge_rooms/', views.admin_purge_rooms),
     path('admin_list_rooms/', views.admin_list_rooms),
     path('set_room_settings/', views.set_room_settings),
-    path('heartbeat/', views.player_heartbeat),
+    path('heartbeat/', hot_views.player_heartbeat),
+    path('time/', views.server_time),
+    path('metrics/', views.metrics_view),
 ]
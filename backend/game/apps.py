@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class GameConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'game'
+
+    def ready(self):
+        # 註冊 room_changed / room_deleted 的接收者
+        from . import broadcast, scheduler, lobby, engine, codes, matchmaking  # noqa: F401
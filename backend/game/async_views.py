@@ -0,0 +1,68 @@
+# get_players、room_sync、player_heartbeat、list_rooms 的非同步版本。
+# 以 ASGI 部署並設定 ASYNC_VIEWS=1 時由 urls.py 採用，每次輪詢不再佔用一條執行緒；
+# 房間狀態來自 engine（記憶體）、心跳只寫 presence store，穩定狀態下完全不碰 ORM。
+from django.views.decorators.csrf import csrf_exempt
+from django.http import JsonResponse
+from asgiref.sync import sync_to_async
+import json
+from .models import Room, Player
+from .engine import get_room_engine
+from .lobby import get_lobby_directory
+from .presence import get_presence_store
+from .views import room_state_response, lobby_response, touch_if_member
+
+
+async def _get_room(room_code):
+    engine = get_room_engine()
+    if engine is not None:
+        room = await engine.aget(room_code)
+        return room, (room.player_list if room is not None else None)
+    room = await Room.objects.filter(room_code=room_code).afirst()
+    return room, ([p async for p in room.players.all()] if room is not None else None)
+
+
+async def get_players(request, room_code):
+    room, players = await _get_room(room_code)
+    if room is None:
+        return JsonResponse({'status': 'error', 'message': '房間不存在'})
+    return room_state_response(request, room, players)
+
+
+@csrf_exempt
+async def room_sync(request, room_code):
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Only POST allowed'})
+    data = json.loads(request.body or b'{}')
+    room, players = await _get_room(room_code)
+    if room is None:
+        return JsonResponse({'status': 'error', 'message': '房間不存在'})
+    touch_if_member(players, data.get('player_id'), autoflush=False)
+    presence = get_presence_store()
+    if presence.flush_due():
+        await sync_to_async(presence.flush)()
+    return room_state_response(request, room, players)
+
+
+@csrf_exempt
+async def player_heartbeat(request):
+    if request.method == 'POST':
+        data = json.loads(request.body)
+        try:
+            player_id = int(data.get('player_id'))
+        except (TypeError, ValueError):
+            return JsonResponse({'status': 'error', 'message': '玩家不存在'}, status=400)
+        presence = get_presence_store()
+        if not presence.is_known(player_id) and not await Player.objects.filter(id=player_id).aexists():
+            return JsonResponse({'status': 'error', 'message': '玩家不存在'}, status=400)
+        presence.touch(player_id, autoflush=False)
+        if presence.flush_due():
+            await sync_to_async(presence.flush)()
+        return JsonResponse({'status': 'ok'})
+
+
+async def list_rooms(request):
+    directory = get_lobby_directory()
+    rooms = directory.cached_rooms()
+    if rooms is None:
+        rooms = await sync_to_async(directory.rooms)()
+    return lobby_response(request, rooms)
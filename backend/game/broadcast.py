@@ -0,0 +1,90 @@
+import asyncio
+import threading
+
+from django.dispatch import receiver
+
+from .signals import room_changed, room_deleted
+
+# room_code -> set(Subscription)，只存在本行程中
+_subscribers = {}
+_lock = threading.Lock()
+
+
+class Subscription:
+    def __init__(self, room_code):
+        self.room_code = room_code
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=8)
+
+    def push(self, message):
+        # 可從任何執行緒呼叫（同步 view 跑在 thread pool 裡）
+        self.loop.call_soon_threadsafe(self._put, message)
+
+    def _put(self, message):
+        # 訂閱者消化不及時丟掉舊的，快照本身就是完整狀態
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+
+def subscribe(room_code):
+    subscription = Subscription(room_code)
+    with _lock:
+        _subscribers.setdefault(room_code, set()).add(subscription)
+    return subscription
+
+
+def unsubscribe(subscription):
+    with _lock:
+        subs = _subscribers.get(subscription.room_code)
+        if subs is None:
+            return
+        subs.discard(subscription)
+        if not subs:
+            del _subscribers[subscription.room_code]
+            # 沒有訂閱者就不必留著上一份快照（其他 worker 刪掉的房間不會送 room_deleted 過來）
+            _published.pop(subscription.room_code, None)
+
+
+def has_subscribers(room_code):
+    return room_code in _subscribers
+
+
+def publish(room_code, message):
+    with _lock:
+        subs = list(_subscribers.get(room_code, ()))
+    for subscription in subs:
+        try:
+            subscription.push(message)
+        except RuntimeError:
+            # event loop 已關閉（連線斷掉但還沒 unsubscribe）
+            unsubscribe(subscription)
+
+
+# room_code -> 最後一次推播的 Snapshot，用來預先算好共用的 delta
+_published = {}
+
+
+@receiver(room_changed)
+def _push_room_state(sender, room, **kwargs):
+    if not has_subscribers(room.room_code):
+        _published.pop(room.room_code, None)
+        return
+    from .snapshots import delta_event, get_snapshot
+    snapshot = get_snapshot(room)
+    previous = _published.get(room.room_code)
+    _published[room.room_code] = snapshot
+    # delta 只編碼一次；上一份收到的就是 previous 的訂閱者（通常是全部）直接送出這份 bytes
+    publish(room.room_code, {
+        'type': 'snapshot',
+        'snapshot': snapshot,
+        'previous': previous,
+        'delta': delta_event(previous, snapshot) if previous is not None else None,
+    })
+
+
+@receiver(room_deleted)
+def _push_room_closed(sender, room_id, room_code, **kwargs):
+    _published.pop(room_code, None)
+    if has_subscribers(room_code):
+        publish(room_code, {'type': 'closed'})
@@ -0,0 +1,133 @@
+"""由伺服器分配的房間代碼。
+
+代碼由 ROOM_CODES 的字母表（去掉 0/O、1/I/L 這類容易看錯的字）組成固定長度，
+全部可能的代碼編號成 0..N-1，以 bitmap（每個代碼 1 bit）記錄是否已被使用：
+4 碼、31 個字時約 92 萬個代碼只佔 113 KiB。分配與釋放都在記憶體完成，不需查資料庫；
+第一次使用時由資料庫載入現有房間，之後靠 room_changed / room_deleted 維持同步。
+多個 worker 各自有一份 bitmap，可能分配到同一個代碼，由 Room.room_code 的 unique 擋下後重試。
+"""
+import random
+import threading
+
+from django.conf import settings
+from django.dispatch import receiver
+
+from .models import Room
+from .signals import room_changed, room_deleted
+
+
+class RoomCodeAllocator:
+    def __init__(self, alphabet, length):
+        self.alphabet = alphabet
+        self.length = length
+        self.size = len(alphabet) ** length
+        self._index = {ch: i for i, ch in enumerate(alphabet)}
+        self._bits = bytearray((self.size + 7) // 8)
+        self._used = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._random = random.SystemRandom()
+
+    # --- 代碼 <-> 編號 ---------------------------------------------
+
+    def encode(self, n):
+        chars = []
+        for _ in range(self.length):
+            n, r = divmod(n, len(self.alphabet))
+            chars.append(self.alphabet[r])
+        return ''.join(reversed(chars))
+
+    def decode(self, code):
+        # 不屬於代碼池（改版前使用者自訂的代碼）時回傳 None
+        if not code or len(code) != self.length:
+            return None
+        n = 0
+        for ch in code:
+            i = self._index.get(ch)
+            if i is None:
+                return None
+            n = n * len(self.alphabet) + i
+        return n
+
+    # --- bitmap ---------------------------------------------
+
+    def _test(self, n):
+        return self._bits[n >> 3] & (1 << (n & 7))
+
+    def _set(self, n):
+        if not self._test(n):
+            self._bits[n >> 3] |= 1 << (n & 7)
+            self._used += 1
+
+    def _clear(self, n):
+        if self._test(n):
+            self._bits[n >> 3] &= ~(1 << (n & 7))
+            self._used -= 1
+
+    def _load(self):
+        if self._loaded:
+            return
+        for code in Room.objects.values_list('room_code', flat=True).iterator():
+            n = self.decode(code)
+            if n is not None:
+                self._set(n)
+        self._loaded = True
+
+    def allocate(self):
+        # 隨機挑選（代碼不可預測），連續撞到已使用的代碼時改為往後找第一個空位
+        with self._lock:
+            self._load()
+            if self._used >= self.size:
+                raise RuntimeError('room code pool exhausted')
+            for _ in range(8):
+                n = self._random.randrange(self.size)
+                if not self._test(n):
+                    self._set(n)
+                    return self.encode(n)
+            start = self._random.randrange(len(self._bits))
+            for offset in range(len(self._bits)):
+                i = (start + offset) % len(self._bits)
+                if self._bits[i] != 0xFF:
+                    for bit in range(8):
+                        n = i * 8 + bit
+                        if n < self.size and not self._test(n):
+                            self._set(n)
+                            return self.encode(n)
+            raise RuntimeError('room code pool exhausted')
+
+    def mark_used(self, code):
+        n = self.decode(code)
+        if n is not None:
+            with self._lock:
+                self._set(n)
+
+    def release(self, code):
+        n = self.decode(code)
+        if n is not None:
+            with self._lock:
+                self._clear(n)
+
+
+_allocator = None
+_allocator_lock = threading.Lock()
+
+
+def get_room_code_allocator():
+    global _allocator
+    if _allocator is None:
+        with _allocator_lock:
+            if _allocator is None:
+                config = settings.ROOM_CODES
+                _allocator = RoomCodeAllocator(config['ALPHABET'], config['LENGTH'])
+    return _allocator
+
+
+@receiver(room_changed)
+def _mark_room_code(sender, room, **kwargs):
+    # 其他 worker 建立的房間（以及改版前使用者自訂的代碼）也要記成已使用
+    get_room_code_allocator().mark_used(room.room_code)
+
+
+@receiver(room_deleted)
+def _release_room_code(sender, room_code, **kwargs):
+    get_room_code_allocator().release(room_code)
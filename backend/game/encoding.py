@@ -0,0 +1,25 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+# orjson 是選用套件（pip install orjson），沒安裝時退回標準 json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(data):
+    # 回傳 UTF-8 bytes；不跳脫中文、不留多餘空白
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+class FastJsonResponse(HttpResponse):
+    """與 JsonResponse 用法相同，改用 dumps 編碼。"""
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
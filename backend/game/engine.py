@@ -0,0 +1,185 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.dispatch import receiver
+
+from .models import Room
+from .presence import get_presence_store
+from .signals import room_changed, room_deleted
+
+logger = logging.getLogger(__name__)
+
+
+class PlayerState:
+    __slots__ = ('id', 'nickname', 'hand_count', 'last_active')
+
+    def __init__(self, player):
+        self.id = player.id
+        self.nickname = player.nickname
+        self.hand_count = player.hand_count
+        self.last_active = player.last_active
+
+
+class RoomState:
+    __slots__ = (
+        'id', 'room_code', 'version', 'started', 'owner_id', 'max_player', 'round_time',
+        'turn_order', 'current_turn_index', 'turn_timer_start_time', 'player_list', 'checked_at',
+    )
+
+    def __init__(self, room, players):
+        self.id = room.id
+        self.room_code = room.room_code
+        self.version = room.version
+        self.started = room.started
+        self.owner_id = room.owner_id
+        self.max_player = room.max_player
+        self.round_time = room.round_time
+        self.turn_order = list(room.turn_order)
+        self.current_turn_index = room.current_turn_index
+        self.turn_timer_start_time = room.turn_timer_start_time
+        self.player_list = [PlayerState(p) for p in players]
+        self.checked_at = time.monotonic()
+
+
+class RoomEngine:
+    """進行中房間的記憶體狀態，讓 get_players 不必經過 ORM。
+
+    寫入仍走資料庫（join_room、advance_turn 等），每次變動透過 room_changed
+    重新載入該房間；其他行程造成的變動則靠 REVALIDATE_SECONDS 比對 version 發現。
+    心跳只存在 presence store，背景執行緒每 PERSIST_SECONDS 把它寫回資料庫，
+    同時清掉已被其他行程刪除的房間；行程掛掉時房間狀態可直接從資料庫重建。
+    房間代碼刪除後可能被新房間重用，比對 version 前要先確認是同一間（id）。
+    """
+
+    def __init__(self, revalidate_seconds=1, persist_seconds=5):
+        self.revalidate_seconds = revalidate_seconds
+        self.persist_seconds = persist_seconds
+        self._rooms = {}            # room_code -> RoomState
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def get(self, room_code):
+        state = self._rooms.get(room_code)
+        if state is not None and self.revalidate_seconds is not None:
+            if time.monotonic() - state.checked_at >= self.revalidate_seconds:
+                version = Room.objects.filter(pk=state.id).values_list('version', flat=True).first()
+                state = self._revalidated(state, version)
+        if state is None:
+            room = Room.objects.filter(room_code=room_code).first()
+            if room is None:
+                self.drop(room_code)
+                return None
+            state = self.load(room)
+        return state
+
+    async def aget(self, room_code):
+        # get 的非同步版本，給 async_views 使用
+        state = self._rooms.get(room_code)
+        if state is not None and self.revalidate_seconds is not None:
+            if time.monotonic() - state.checked_at >= self.revalidate_seconds:
+                version = await Room.objects.filter(pk=state.id).values_list('version', flat=True).afirst()
+                state = self._revalidated(state, version)
+        if state is None:
+            room = await Room.objects.filter(room_code=room_code).afirst()
+            if room is None:
+                self.drop(room_code)
+                return None
+            state = self._store(room, [p async for p in room.players.order_by('id')])
+        return state
+
+    def _revalidated(self, state, version):
+        # 回傳仍可使用的 state；版本不同要重新載入，房間已被刪除（version 為 None）就先移除
+        if version == state.version:
+            state.checked_at = time.monotonic()
+            return state
+        if version is None:
+            self.drop(state.room_code, state.id)
+        return None
+
+    def load(self, room):
+        return self._store(room, room.players.order_by('id'))
+
+    def _store(self, room, players):
+        state = RoomState(room, players)
+        with self._lock:
+            current = self._rooms.get(room.room_code)
+            # 同一間房只接受較新的版本；代碼被新房間重用時直接取代
+            if current is None or current.id != state.id or current.version <= state.version:
+                self._rooms[room.room_code] = state
+        self.start()
+        return state
+
+    def has(self, room_code):
+        return room_code in self._rooms
+
+    def drop(self, room_code, room_id=None):
+        # 指定 room_id 時只在快取的仍是那間房時移除（代碼可能已被新房間重用）
+        with self._lock:
+            current = self._rooms.get(room_code)
+            if current is not None and (room_id is None or current.id == room_id):
+                del self._rooms[room_code]
+
+    def prune(self):
+        # 移除已被其他行程刪除的房間，它們不會再收到 room_deleted
+        cached = {state.id: state.room_code for state in list(self._rooms.values())}
+        if not cached:
+            return
+        alive = set(Room.objects.filter(pk__in=cached).values_list('id', flat=True))
+        for room_id, room_code in cached.items():
+            if room_id not in alive:
+                self.drop(room_code, room_id)
+
+    def start(self):
+        if self._thread is not None or not self.persist_seconds:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._persist, name='room-engine-persist', daemon=True)
+            self._thread.start()
+
+    def _persist(self):
+        while True:
+            time.sleep(self.persist_seconds)
+            try:
+                get_presence_store().flush()
+                self.prune()
+            except Exception:
+                logger.exception('room engine persist error')
+            finally:
+                close_old_connections()
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_room_engine():
+    # GAME_ENGINE['ENABLED'] 為 False 時回傳 None，view 直接查資料庫
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                config = dict(getattr(settings, 'GAME_ENGINE', {}))
+                enabled = config.pop('ENABLED', False)
+                _engine = RoomEngine(**{k.lower(): v for k, v in config.items()}) if enabled else False
+    return _engine or None
+
+
+@receiver(room_changed)
+def _reload_room(sender, room, **kwargs):
+    engine = get_room_engine()
+    if engine is not None and engine.has(room.room_code):
+        room = Room.objects.filter(pk=room.pk).first()
+        if room is not None:
+            engine.load(room)
+
+
+@receiver(room_deleted)
+def _drop_room(sender, room_id, room_code, **kwargs):
+    engine = get_room_engine()
+    if engine is not None:
+        engine.drop(room_code, room_id)
@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import RoomEvent
+
+
+def compact_room_events(keep_events=None, keep_seconds=None):
+    """刪除舊的 RoomEvent：超出每間房最新 keep_events 筆、或早於 keep_seconds 秒的事件。
+
+    Room 列本身一直是最新狀態，journal 只用來讓客戶端補齊變動，清掉的部分
+    客戶端會收到 reset 改抓完整狀態。一條 DELETE 完成，回傳刪除筆數。
+    """
+    if keep_events is None:
+        keep_events = settings.ROOM_JOURNAL['KEEP_EVENTS']
+    if keep_seconds is None:
+        keep_seconds = settings.ROOM_JOURNAL['KEEP_SECONDS']
+    cutoff = timezone.now() - timedelta(seconds=keep_seconds)
+    stale = Q(seq__lte=F('room__version') - keep_events) | Q(created_at__lt=cutoff)
+    deleted, _ = RoomEvent.objects.filter(stale).delete()
+    return deleted
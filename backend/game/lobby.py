@@ -0,0 +1,170 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .models import Room
+from .signals import room_changed, room_deleted
+
+
+def _load_rooms():
+    rooms = (
+        Room.objects.filter(started=False)
+        .annotate(player_count=Count('players'))
+        .order_by('id')
+        .values_list('id', 'version', 'room_code', 'player_count', 'max_player')
+    )
+    return [(room_id, version, _entry(code, count, max_player))
+            for room_id, version, code, count, max_player in rooms]
+
+
+def _entry(room_code, player_count, max_player):
+    return {'room_code': room_code, 'player_count': player_count, 'max_player': max_player}
+
+
+class LobbyDirectory:
+    """/rooms/ 大廳列表的快取。
+
+    rooms() 回傳依 id 排序的 [(room_id, {'room_code', 'player_count', 'max_player'})]，
+    只包含未開始的房間；房間變動時由 room_changed / room_deleted 更新。
+    """
+
+    def rooms(self):
+        raise NotImplementedError
+
+    def cached_rooms(self):
+        # 不需要 I/O 就能取得的列表，沒有則回傳 None（給 async view 判斷是否要換到執行緒）
+        return None
+
+    def room_changed(self, room, player_count=None):
+        # player_count：room_changed 帶來的人數，None 表示呼叫端不知道
+        raise NotImplementedError
+
+    def room_deleted(self, room_id):
+        raise NotImplementedError
+
+
+class LocalLobbyDirectory(LobbyDirectory):
+    """存在本行程記憶體，只重算有變動的那一間房。
+
+    其他 worker 建立、刪除房間不會通知本行程，所以每 reload_seconds 從資料庫整份重建一次
+    （None 表示只載入一次，只有單一行程時使用）。
+    """
+
+    def __init__(self, reload_seconds=5):
+        self.reload_seconds = reload_seconds
+        self._rooms = None        # room_id -> (version, entry)
+        self._listing = None
+        self._loaded_at = None
+        self._generation = 0      # 有變動就 +1，整批載入期間有變動就不採用載入結果
+        self._lock = threading.Lock()
+
+    def _expired(self):
+        loaded_at = self._loaded_at
+        return (loaded_at is not None and self.reload_seconds is not None
+                and time.monotonic() - loaded_at >= self.reload_seconds)
+
+    def cached_rooms(self):
+        return None if self._expired() else self._listing
+
+    def rooms(self):
+        if self._expired():
+            with self._lock:
+                if self._expired():
+                    self._rooms = self._listing = self._loaded_at = None
+        listing = self._listing
+        if listing is not None:
+            return listing
+        with self._lock:
+            if self._rooms is not None:
+                self._listing = [(room_id, self._rooms[room_id][1]) for room_id in sorted(self._rooms)]
+                return self._listing
+            generation = self._generation
+        rooms = {room_id: (version, entry) for room_id, version, entry in _load_rooms()}
+        listing = [(room_id, rooms[room_id][1]) for room_id in sorted(rooms)]
+        with self._lock:
+            if self._generation == generation and self._rooms is None:
+                self._rooms, self._listing = rooms, listing
+                self._loaded_at = time.monotonic()
+        return listing
+
+    def room_changed(self, room, player_count=None):
+        if self._rooms is None:
+            with self._lock:
+                self._generation += 1
+            return
+        if player_count is None and not room.started:
+            # 轉移房主、修改設定不會改變人數，沿用快取裡的值
+            current = self._rooms.get(room.id)
+            player_count = current[1]['player_count'] if current is not None else room.players.count()
+        entry = None if room.started else _entry(room.room_code, player_count, room.max_player)
+        with self._lock:
+            self._generation += 1
+            if self._rooms is None:
+                return
+            current = self._rooms.get(room.id)
+            if current is not None and current[0] > room.version:
+                return
+            if entry is None:
+                self._rooms.pop(room.id, None)
+            else:
+                self._rooms[room.id] = (room.version, entry)
+            self._listing = None
+
+    def room_deleted(self, room_id):
+        with self._lock:
+            self._generation += 1
+            if self._rooms is not None and self._rooms.pop(room_id, None) is not None:
+                self._listing = None
+
+
+class CacheLobbyDirectory(LobbyDirectory):
+    """整份列表放在 Django cache，多個 worker 共用；有變動就讓快取失效，下次讀取再重建。"""
+
+    key = 'lobby:rooms'
+
+    def __init__(self, cache_alias='default', timeout=60):
+        self.cache = caches[cache_alias]
+        self.timeout = timeout
+
+    def rooms(self):
+        listing = self.cache.get(self.key)
+        if listing is None:
+            listing = [(room_id, entry) for room_id, _, entry in _load_rooms()]
+            self.cache.add(self.key, listing, timeout=self.timeout)
+        return listing
+
+    def room_changed(self, room, player_count=None):
+        self.cache.delete(self.key)
+
+    def room_deleted(self, room_id):
+        self.cache.delete(self.key)
+
+
+_directory = None
+_directory_lock = threading.Lock()
+
+
+def get_lobby_directory():
+    global _directory
+    if _directory is None:
+        with _directory_lock:
+            if _directory is None:
+                config = dict(getattr(settings, 'LOBBY_DIRECTORY', {}))
+                backend = import_string(config.pop('BACKEND', 'game.lobby.LocalLobbyDirectory'))
+                _directory = backend(**{k.lower(): v for k, v in config.items()})
+    return _directory
+
+
+@receiver(room_changed)
+def _update_lobby(sender, room, player_count=None, **kwargs):
+    get_lobby_directory().room_changed(room, player_count)
+
+
+@receiver(room_deleted)
+def _remove_from_lobby(sender, room_id, **kwargs):
+    get_lobby_directory().room_deleted(room_id)
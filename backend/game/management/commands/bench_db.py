@@ -0,0 +1,131 @@
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connections
+from django.db.models import Count
+from django.utils import timezone
+
+from game.management.harness import closing_connections, passthrough, percentile, run_manage
+from game.models import Room, Player
+from game.state import build_room_state
+
+
+class Command(BaseCommand):
+    help = ('以多執行緒混合執行熱門查詢（房間狀態、大廳列表、心跳寫回、加入/離開、離線掃描），'
+            '量測目前 DB_PROFILE 的效能；--compare 可依序比較多個設定')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=10)
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--rooms', type=int, default=50)
+        parser.add_argument('--players', type=int, default=6, help='每間房的玩家數')
+        parser.add_argument('--compare', nargs='+', metavar='PROFILE',
+                            help='各自建立暫存資料庫並執行一次，例如 --compare sqlite sqlite-wal')
+
+    def handle(self, *args, **options):
+        if options['compare']:
+            return self.compare(options)
+        self.stdout.write(f'DB_PROFILE={settings.DB_PROFILE} ({connections["default"].vendor})')
+        rooms = self.seed(options)
+        try:
+            self.run(rooms, options)
+        finally:
+            Room.objects.filter(id__in=[room.id for room in rooms]).delete()
+
+    def compare(self, options):
+        args = passthrough(options, ('seconds', 'readers', 'writers', 'rooms', 'players'))
+        for profile in options['compare']:
+            with tempfile.TemporaryDirectory() as tmp:
+                env = dict(os.environ, DB_PROFILE=profile)
+                if profile.startswith('sqlite'):
+                    env['DB_NAME'] = os.path.join(tmp, 'bench.sqlite3')
+                run_manage('migrate', '-v0', env=env)
+                run_manage('bench_db', *args, env=env)
+            self.stdout.write('')
+
+    def seed(self, options):
+        prefix = uuid.uuid4().hex[:4]
+        rooms = []
+        for i in range(options['rooms']):
+            room = Room.objects.create(room_code=f'bd{prefix}{i}')
+            Player.objects.bulk_create(
+                Player(room=room, nickname=f'p{j}') for j in range(options['players'])
+            )
+            room.owner = room.players.order_by('join_time').first()
+            room.save(update_fields=['owner'])
+            rooms.append(room)
+        return rooms
+
+    def run(self, rooms, options):
+        codes = [room.room_code for room in rooms]
+        player_ids = list(Player.objects.filter(room__in=rooms).values_list('id', flat=True))
+
+        def read_state():
+            build_room_state(Room.objects.get(room_code=random.choice(codes)))
+
+        def lobby():
+            list(Room.objects.filter(started=False).annotate(player_count=Count('players'))
+                 .values('room_code', 'player_count', 'max_player'))
+
+        def reaper_scan():
+            cutoff = timezone.now() - timedelta(seconds=60)
+            list(Player.objects.filter(room__started=False, last_active__lt=cutoff).values_list('id', 'room_id'))
+
+        def heartbeat_flush():
+            now = timezone.now()
+            batch = random.sample(player_ids, min(len(player_ids), 50))
+            Player.objects.bulk_update([Player(id=pid, last_active=now) for pid in batch], ['last_active'])
+
+        def join_leave():
+            room = random.choice(rooms)
+            player = Player.objects.create(room=room, nickname=f'x{uuid.uuid4().hex[:8]}')
+            room.players.order_by('join_time').values_list('id', flat=True).first()
+            player.delete()
+
+        read_ops = [read_state, read_state, read_state, lobby, reaper_scan]
+        write_ops = [heartbeat_flush, join_leave]
+        results = {op.__name__: [] for op in read_ops + write_ops}
+        errors = {name: 0 for name in results}
+        lock = threading.Lock()
+        deadline = time.perf_counter() + options['seconds']
+
+        @closing_connections
+        def worker(ops):
+            latencies = {name: [] for name in results}
+            failed = {name: 0 for name in results}
+            while time.perf_counter() < deadline:
+                op = random.choice(ops)
+                began = time.perf_counter()
+                try:
+                    op()
+                except DatabaseError:
+                    failed[op.__name__] += 1
+                    continue
+                latencies[op.__name__].append(time.perf_counter() - began)
+            with lock:
+                for name in results:
+                    results[name] += latencies[name]
+                    errors[name] += failed[name]
+
+        threads = [threading.Thread(target=worker, args=(read_ops,)) for _ in range(options['readers'])]
+        threads += [threading.Thread(target=worker, args=(write_ops,)) for _ in range(options['writers'])]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.stdout.write(f'{"operation":<16}{"count":>8}{"ops/s":>10}{"p50 ms":>10}{"p99 ms":>10}{"errors":>8}')
+        for name, latencies in results.items():
+            latencies.sort()
+            self.stdout.write(
+                f'{name:<16}{len(latencies):>8}{len(latencies) / options["seconds"]:>10.0f}'
+                f'{percentile(latencies, 0.5):>10.2f}{percentile(latencies, 0.99):>10.2f}{errors[name]:>8}'
+            )
@@ -0,0 +1,97 @@
+import time
+import tracemalloc
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from game import encoding
+from game.engine import RoomState
+from game.models import Room, Player
+from game.presence import get_presence_store
+from game.snapshots import get_snapshot
+from game.state import IDLE_SECONDS, build_room_state, get_current_timer, idle_player_ids, player_rows
+
+
+def legacy_response(room):
+    # 改寫前的 get_players：完整的 Player 物件、逐一計算 idle、離線名單另外查一次、JsonResponse 編碼
+    presence = get_presence_store()
+    now = timezone.now()
+    players = []
+    for p in room.players.all():
+        idle = (now - presence.last_active(p.id, p.last_active)) > timedelta(seconds=IDLE_SECONDS)
+        players.append({'id': p.id, 'nickname': p.nickname, 'handCount': p.hand_count, 'idle': idle})
+    cutoff = now - timedelta(seconds=IDLE_SECONDS)
+    idle_ids = [pid for pid, last_active in room.players.order_by('id').values_list('id', 'last_active')
+                if presence.last_active(pid, last_active) < cutoff]
+    return JsonResponse({
+        'status': 'ok', 'room_code': room.room_code, 'version': room.version, 'players': players,
+        'started': room.started, 'owner_id': room.owner_id, 'round_time': room.round_time,
+        'turn_order': room.turn_order, 'current_turn_index': room.current_turn_index,
+        'timer': get_current_timer(room), 'idle_count': len(idle_ids),
+    })
+
+
+def current_response(room, players=None):
+    rows = player_rows(room, players)
+    idle_ids = idle_player_ids(room, rows=rows)
+    return encoding.FastJsonResponse({'status': 'ok', **build_room_state(room, rows=rows, idle_ids=idle_ids)})
+
+
+def snapshot_response(room):
+    # 與 room_state_response 相同：仍要算離線名單決定快取鍵，之後直接取用已編碼的 bytes
+    snapshot = get_snapshot(room, room.player_list)
+    return HttpResponse(snapshot.response_body(1000, get_current_timer(room)), content_type='application/json')
+
+
+class Command(BaseCommand):
+    help = '比較 get_players 回應的序列化成本（每次回應的 CPU 時間與配置的記憶體），改寫前後對照（請用測試用資料庫）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--players', type=int, default=10)
+        parser.add_argument('--iterations', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        room = Room.objects.create(room_code=f'bs{uuid.uuid4().hex[:6]}', started=True, round_time=20,
+                                   turn_timer_start_time=timezone.now())
+        ids = [Player.objects.create(room=room, nickname=f'玩家{i}', hand_count=i).id
+               for i in range(options['players'])]
+        room.turn_order = ids
+        room.save()
+        state = RoomState(room, list(room.players.all()))
+        fast_encoder = encoding.orjson
+
+        cases = [
+            ('legacy (Player objects + JsonResponse)', lambda: legacy_response(room)),
+            ('values_list + stdlib json', lambda: current_response(room)),
+        ]
+        if fast_encoder is not None:
+            cases.append(('values_list + orjson', lambda: current_response(room)))
+        cases.append(('engine (in memory) + ' + ('orjson' if fast_encoder else 'stdlib json'),
+                      lambda: current_response(state, state.player_list)))
+        cases.append(('engine + snapshot cache hit', lambda: snapshot_response(state)))
+
+        self.stdout.write(f'{options["players"]} players, {options["iterations"]} responses per case'
+                          + ('' if fast_encoder else ' (orjson not installed)'))
+        self.stdout.write(f'{"case":<42}{"cpu us":>9}{"alloc KiB":>11}{"blocks":>8}{"bytes":>7}')
+        try:
+            for name, build in cases:
+                encoding.orjson = fast_encoder if 'stdlib' not in name else None
+                size = len(build().content)
+                began = time.process_time()
+                for _ in range(options['iterations']):
+                    build()
+                cpu = (time.process_time() - began) / options['iterations']
+                # 單次回應配置的記憶體（峰值）與仍存活的區塊數
+                tracemalloc.start()
+                response = build()
+                blocks = len(tracemalloc.take_snapshot().traces)
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                del response
+                self.stdout.write(f'{name:<42}{cpu * 1e6:>9.0f}{peak / 1024:>11.1f}{blocks:>8}{size:>7}')
+        finally:
+            encoding.orjson = fast_encoder
+            room.delete()
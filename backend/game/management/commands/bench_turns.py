@@ -0,0 +1,70 @@
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.utils import timezone
+
+from game.management.harness import closing_connections, percentile
+from game.models import Room, Player
+
+
+class Command(BaseCommand):
+    help = '多個執行緒同時對同一回合送出 next_turn，檢查每回合只換一次人（請用測試用資料庫）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--players', type=int, default=6)
+        parser.add_argument('--rounds', type=int, default=100)
+        parser.add_argument('--threads', type=int, default=16, help='每回合同時送出 next_turn 的執行緒數')
+
+    def handle(self, *args, **options):
+        threads, rounds = options['threads'], options['rounds']
+        # round_time=0：不限時，避免排程器在測試中途換人
+        room = Room.objects.create(room_code=f'bt{uuid.uuid4().hex[:6]}', round_time=0, started=True,
+                                   turn_timer_start_time=timezone.now())
+        ids = [Player.objects.create(room=room, nickname=f'p{i}').id for i in range(options['players'])]
+        room.turn_order = ids
+        room.save()
+
+        barrier = threading.Barrier(threads)
+        local = threading.local()
+        advanced = []
+        latencies = []
+        lock = threading.Lock()
+
+        @closing_connections
+        def worker(_):
+            client = getattr(local, 'client', None) or Client()
+            local.client = client
+            for turn in range(rounds):
+                barrier.wait()
+                # 所有執行緒都想結束同一回合
+                body = json.dumps({'room_code': room.room_code, 'turn_index': turn % len(ids)})
+                began = time.perf_counter()
+                data = client.post('/next_turn/', body, content_type='application/json').json()
+                with lock:
+                    latencies.append(time.perf_counter() - began)
+                    if data.get('advanced'):
+                        advanced.append(turn)
+
+        began = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(worker, range(threads)))
+        elapsed = time.perf_counter() - began
+
+        room.refresh_from_db()
+        latencies.sort()
+        total = len(latencies)
+        self.stdout.write(f'{total} next_turn requests in {elapsed:.2f}s ({total / elapsed:.0f} req/s)')
+        self.stdout.write(f'p50 {percentile(latencies, 0.5):.1f} ms, p99 {percentile(latencies, 0.99):.1f} ms')
+        self.stdout.write(f'advanced {len(advanced)} times for {rounds} rounds, '
+                          f'final index {room.current_turn_index}')
+        room.delete()
+        if sorted(advanced) != list(range(rounds)):
+            raise CommandError('some rounds were advanced more or less than once')
+        if room.current_turn_index != rounds % len(ids):
+            raise CommandError('final turn index is wrong')
+        self.stdout.write(self.style.SUCCESS('every round advanced exactly once'))
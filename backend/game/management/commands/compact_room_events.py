@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from game.journal import compact_room_events
+
+
+class Command(BaseCommand):
+    help = '清除舊的房間事件（RoomEvent），只保留每間房最新的事件'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep', type=int, default=None, help='每間房保留幾筆（預設 ROOM_JOURNAL KEEP_EVENTS）')
+        parser.add_argument('--older-than', type=int, default=None,
+                            help='早於幾秒的事件一律刪除（預設 ROOM_JOURNAL KEEP_SECONDS）')
+        parser.add_argument('--interval', type=int, default=0, help='大於 0 時每隔幾秒重複執行')
+
+    def handle(self, *args, **options):
+        while True:
+            deleted = compact_room_events(options['keep'], options['older_than'])
+            self.stdout.write(f'removed {deleted} events')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
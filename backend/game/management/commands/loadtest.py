@@ -0,0 +1,237 @@
+import heapq
+import json
+import random
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.urls import resolve
+
+from game.management.harness import percentile
+from game.models import Room
+
+
+class Simulation:
+    """以模擬時鐘重現前端的行為，依時間順序在本行程內逐一送出請求。
+
+    - JoinRoom.vue：每 3 秒 GET /rooms/
+    - RoomLobby.vue：依回應的 next_poll_ms（--ignore-poll-hints 時每秒）POST /room/<code>/sync/
+      （--legacy 時改為 heartbeat + players），
+      房主偶爾修改設定、轉移房主、踢人，人數夠時開始遊戲；一般玩家偶爾離開再加入
+    - GamePlay.vue：同樣依 next_poll_ms GET /room/<code>/players/?since=，輪到自己時送 next_turn
+    - AdminLobby.vue：每 5 秒 GET /admin_list_rooms/ 與 /rooms/state/
+
+    模擬時鐘只決定送出請求的順序，不會快轉伺服器的 timezone.now()：整段模擬通常在幾秒的
+    實際時間內跑完，所以回合到期（排程器換人）、離線判定與 reaper 清人都不會發生，
+    遊戲中換人只來自輪到的玩家送出的 next_turn。要量測這些請用 loadtest_pollers（實際時間）。
+    """
+
+    def __init__(self, options):
+        self.options = options
+        self.random = random.Random(options['seed'])
+        self.client = Client()
+        self.events = []
+        self.seq = 0
+        self.stats = defaultdict(lambda: {'latency': [], 'queries': [], 'errors': 0})
+        self.rooms = {}         # room_code -> {'members': set(client_id), 'owner': player_id, 'started': bool}
+        self.members = {}       # client_id -> {'room': code, 'player_id': id, 'nickname', 'version', 'state'}
+
+    # --- 請求與統計 -------------------------------------------------
+
+    def request(self, method, path, data=None):
+        queries = []
+
+        def count(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        began = time.perf_counter()
+        with connection.execute_wrapper(count):
+            if method == 'GET':
+                response = self.client.get(path)
+            else:
+                response = self.client.post(path, json.dumps(data or {}), content_type='application/json')
+        elapsed = time.perf_counter() - began
+        stat = self.stats[resolve(path.split('?')[0]).route]
+        stat['latency'].append(elapsed)
+        stat['queries'].append(len(queries))
+        body = json.loads(response.content) if response.content else {}
+        if response.status_code >= 500 or (response.status_code != 304 and body.get('status') == 'error'):
+            stat['errors'] += 1
+        return body
+
+    def schedule(self, at, action, client_id):
+        self.seq += 1
+        heapq.heappush(self.events, (at, self.seq, action, client_id))
+
+    # --- 建立初始狀態 -------------------------------------------------
+
+    def setup(self):
+        options = self.options
+        member_count = int(options['clients'] * 0.85)
+        client_id = 0
+        for _ in range(member_count):
+            # 前 --rooms 位玩家各建立一間房（代碼由伺服器分配），之後的玩家輪流加入
+            codes = list(self.rooms)
+            code = codes[client_id % len(codes)] if len(codes) >= options['rooms'] else None
+            if self.join(client_id, code):
+                self.schedule(self.random.uniform(0, 1), 'poll', client_id)
+            client_id += 1
+        for _ in range(options['clients'] - member_count - 1):
+            self.schedule(self.random.uniform(0, 3), 'browse', client_id)
+            client_id += 1
+        self.schedule(self.random.uniform(0, 5), 'admin', client_id)
+
+    def join(self, client_id, code=None):
+        # code 為 None 時建立新房間
+        body = {'nickname': f'c{client_id}', 'max_player': 10}
+        if code is not None:
+            body['room_code'] = code
+        data = self.request('POST', '/join/', body)
+        if data.get('status') != 'ok':
+            return False
+        code = data['room_code']
+        self.rooms.setdefault(code, {'members': set(), 'owner': None, 'started': False})
+        self.members[client_id] = {'room': code, 'player_id': data['player_id'], 'version': None, 'state': {}}
+        self.rooms[code]['members'].add(client_id)
+        return True
+
+    # --- 各種客戶端 -------------------------------------------------
+
+    def browse(self, now, client_id):
+        self.request('GET', '/rooms/')
+        self.schedule(now + 3, 'browse', client_id)
+
+    def admin(self, now, client_id):
+        self.request('GET', '/admin_list_rooms/')
+        self.request('GET', '/rooms/state/?limit=50')
+        self.schedule(now + 5, 'admin', client_id)
+
+    def poll(self, now, client_id):
+        member = self.members.get(client_id)
+        if member is None:
+            return
+        code = member['room']
+        since = f'?since={member["version"]}' if member['version'] is not None else ''
+        if member['state'].get('started'):
+            data = self.request('GET', f'/room/{code}/players/{since}')
+        elif self.options['legacy']:
+            self.request('POST', '/heartbeat/', {'player_id': member['player_id'], 'room_code': code})
+            data = self.request('GET', f'/room/{code}/players/{since}')
+        else:
+            data = self.request('POST', f'/room/{code}/sync/{since}', {'player_id': member['player_id']})
+        if data.get('status') == 'error':
+            self.drop(client_id)
+            return
+        if not data.get('unchanged'):
+            member['state'] = data
+            member['version'] = data.get('version')
+        self.act(now, client_id, member)
+        interval = 1 if self.options['ignore_poll_hints'] else data.get('next_poll_ms', 1000) / 1000
+        self.schedule(now + interval, 'poll', client_id)
+
+    def act(self, now, client_id, member):
+        state, code, player_id = member['state'], member['room'], member['player_id']
+        roll = self.random.random()
+        is_owner = state.get('owner_id') == player_id
+        players = state.get('players', [])
+        if state.get('started'):
+            order = state.get('turn_order') or []
+            index = state.get('current_turn_index', 0)
+            if order and order[index % len(order)] == player_id and roll < 0.3:
+                self.request('POST', '/next_turn/', {'room_code': code, 'turn_index': index})
+            return
+        if is_owner and len(players) >= 3 and now > self.options['start_after'] and roll < 0.05:
+            self.request('POST', '/start/', {'room_code': code})
+        elif is_owner and roll < 0.01:
+            self.request('POST', '/set_room_settings/', {
+                'room_code': code, 'owner_id': player_id, 'round_time': self.random.choice([5, 20, 60, 0]),
+            })
+        elif is_owner and roll < 0.015 and len(players) > 1:
+            target = self.random.choice([p['id'] for p in players if p['id'] != player_id])
+            self.request('POST', '/transfer_owner/', {'room_code': code, 'owner_id': player_id, 'new_owner_id': target})
+        elif is_owner and roll < 0.02 and len(players) > 1:
+            target = self.random.choice([p['id'] for p in players if p['id'] != player_id])
+            self.request('POST', '/kick_player/', {'room_code': code, 'owner_id': player_id, 'target_player_id': target})
+        elif not is_owner and roll < 0.005:
+            self.request('POST', '/leave/', {'player_id': player_id, 'room_code': code})
+            self.drop(client_id)
+            if self.join(client_id, code):
+                self.schedule(now + 1, 'poll', client_id)
+
+    def drop(self, client_id):
+        member = self.members.pop(client_id, None)
+        if member is not None:
+            self.rooms[member['room']]['members'].discard(client_id)
+
+    # --- 主迴圈 -------------------------------------------------
+
+    def run(self):
+        began = time.perf_counter()
+        self.setup()
+        while self.events and self.events[0][0] < self.options['seconds']:
+            now, _, action, client_id = heapq.heappop(self.events)
+            getattr(self, action)(now, client_id)
+        return time.perf_counter() - began
+
+    def cleanup(self):
+        Room.objects.filter(room_code__in=list(self.rooms)).delete()
+
+
+class Command(BaseCommand):
+    help = ('模擬大量大廳與遊戲中的客戶端（不經網路），回報每個 API 的吞吐量、p50/p99 延遲與每次請求的查詢數；'
+            '可用 --budget 設定上限，超過時以錯誤結束（請用測試用資料庫）。'
+            '模擬時鐘比伺服器的實際時間快，回合到期、離線判定與 reaper 不會在模擬中觸發')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=1000)
+        parser.add_argument('--rooms', type=int, default=150)
+        parser.add_argument('--seconds', type=float, default=20, help='模擬的秒數')
+        parser.add_argument('--start-after', type=float, default=5, help='模擬開始幾秒後房主才會開始遊戲')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--legacy', action='store_true', help='大廳使用 heartbeat + players 兩個請求，而不是 sync')
+        parser.add_argument('--ignore-poll-hints', action='store_true',
+                            help='固定每秒輪詢，不依回應中的 next_poll_ms')
+        parser.add_argument('--budget', action='append', default=[], metavar='ROUTE=QUERIES[:P99_MS]',
+                            help="例如 --budget 'room/<str:room_code>/players/=0:5'")
+
+    def handle(self, *args, **options):
+        simulation = Simulation(options)
+        try:
+            elapsed = simulation.run()
+        finally:
+            simulation.cleanup()
+
+        total = sum(len(s['latency']) for s in simulation.stats.values())
+        self.stdout.write(f'{total} requests in {elapsed:.2f}s ({total / elapsed:.0f} req/s), '
+                          f'{options["clients"]} clients, {options["seconds"]:.0f} simulated seconds '
+                          f'(server clock not advanced: no turn deadlines, idle detection or reaping)')
+        self.stdout.write(f'{"route":<36}{"count":>8}{"req/s":>8}{"p50 ms":>9}{"p99 ms":>9}'
+                          f'{"avg q":>7}{"max q":>7}{"errors":>8}')
+        rows = {}
+        for route, stat in sorted(simulation.stats.items(), key=lambda item: -len(item[1]['latency'])):
+            latency = sorted(stat['latency'])
+            avg_queries = sum(stat['queries']) / len(stat['queries'])
+            rows[route] = (avg_queries, percentile(latency, 0.99))
+            self.stdout.write(
+                f'{route:<36}{len(latency):>8}{len(latency) / elapsed:>8.0f}'
+                f'{percentile(latency, 0.5):>9.2f}{percentile(latency, 0.99):>9.2f}'
+                f'{avg_queries:>7.2f}{max(stat["queries"]):>7}{stat["errors"]:>8}'
+            )
+
+        failures = []
+        for budget in options['budget']:
+            route, _, limits = budget.rpartition('=')
+            max_queries, _, max_p99 = limits.partition(':')
+            if route not in rows:
+                failures.append(f'{route}: no requests')
+                continue
+            avg_queries, p99 = rows[route]
+            if avg_queries > float(max_queries):
+                failures.append(f'{route}: {avg_queries:.2f} queries/request > {max_queries}')
+            if max_p99 and p99 > float(max_p99):
+                failures.append(f'{route}: p99 {p99:.2f} ms > {max_p99} ms')
+        if failures:
+            raise CommandError('budget exceeded: ' + '; '.join(failures))
@@ -0,0 +1,83 @@
+import json
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from game.management.harness import closing_connections
+from game.models import Room
+
+
+class Command(BaseCommand):
+    help = '同時對 join_room 送出大量加入請求，檢查房間人數上限與暱稱唯一沒有被打破（請用測試用資料庫）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=5)
+        parser.add_argument('--joins', type=int, default=300, help='每間房間的加入請求數')
+        parser.add_argument('--threads', type=int, default=64)
+        parser.add_argument('--max-player', type=int, default=10)
+        parser.add_argument('--keep', action='store_true', help='結束後保留測試房間')
+
+    def handle(self, *args, **options):
+        # 先由房主建立房間（代碼由伺服器分配），再同時送出加入請求
+        created = []
+        for _ in range(options['rooms']):
+            body = json.dumps({'nickname': 'host', 'max_player': options['max_player']})
+            data = Client().post('/join/', body, content_type='application/json').json()
+            if data['status'] != 'ok':
+                raise CommandError(f'could not create a room: {data.get("message")}')
+            created.append((data['room_code'], 'ok'))
+        codes = [code for code, _ in created]
+        # 每個暱稱送兩次，同時驗證 (room, nickname) 唯一
+        tasks = [(code, f'p{j // 2}') for j in range(options['joins']) for code in codes]
+        local = threading.local()
+        start = threading.Barrier(options['threads'])
+
+        def join(task):
+            if not hasattr(local, 'client'):
+                local.client = Client()
+                try:
+                    start.wait(timeout=5)
+                except threading.BrokenBarrierError:
+                    pass
+            code, nickname = task
+            body = json.dumps({'room_code': code, 'nickname': nickname, 'max_player': options['max_player']})
+            response = local.client.post('/join/', body, content_type='application/json')
+            data = response.json()
+            return code, data.get('message') or data['status']
+
+        @closing_connections
+        def run(chunk):
+            return [join(task) for task in chunk]
+
+        chunks = [tasks[i::options['threads']] for i in range(options['threads'])]
+        began = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            results = [r for chunk in pool.map(run, chunks) for r in chunk]
+        elapsed = time.perf_counter() - began
+
+        outcomes = Counter(message for _, message in results)
+        self.stdout.write(f'{len(results)} joins in {elapsed:.2f}s ({len(results) / elapsed:.0f} req/s)')
+        for message, count in outcomes.most_common():
+            self.stdout.write(f'  {count:6d}  {message}')
+
+        failures = []
+        results += created
+        for room in Room.objects.filter(room_code__in=codes):
+            nicknames = list(room.players.values_list('nickname', flat=True))
+            ok = sum(1 for code, message in results if code == room.room_code and message == 'ok')
+            self.stdout.write(f'{room.room_code}: {len(nicknames)}/{room.max_player} players, {ok} ok responses')
+            if len(nicknames) > room.max_player:
+                failures.append(f'{room.room_code} overfilled')
+            if len(nicknames) != len(set(nicknames)):
+                failures.append(f'{room.room_code} has duplicate nicknames')
+            if ok != len(nicknames):
+                failures.append(f'{room.room_code} answered ok {ok} times for {len(nicknames)} players')
+        if not options['keep']:
+            Room.objects.filter(room_code__in=codes).delete()
+        if failures:
+            raise CommandError('; '.join(failures))
+        self.stdout.write(self.style.SUCCESS('capacity and nickname uniqueness held'))
@@ -0,0 +1,114 @@
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+
+from game.management.harness import passthrough, percentile, run_manage
+from game.models import Room, Player
+
+
+async def _call(app, method, path, body=b''):
+    # 直接呼叫 ASGI application，不經過網路
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': method, 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', b'loadtest'), (b'content-type', b'application/json')],
+        'client': ('127.0.0.1', 0), 'server': ('loadtest', 80),
+    }
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    status = []
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    await app(scope, receive, send)
+    return status[0] if status else None
+
+
+class Command(BaseCommand):
+    help = ('在同一個行程內透過 ASGI 模擬大量每秒輪詢的客戶端（get_players + heartbeat），'
+            '回報實際吞吐量與延遲；--compare 會分別以同步與非同步 view 各跑一次')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pollers', type=int, default=500)
+        parser.add_argument('--rooms', type=int, default=50)
+        parser.add_argument('--seconds', type=float, default=10)
+        parser.add_argument('--interval', type=float, default=1.0, help='每個客戶端的輪詢間隔（秒）')
+        parser.add_argument('--compare', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['compare']:
+            args = passthrough(options, ('pollers', 'rooms', 'seconds', 'interval'))
+            for mode in ('0', '1'):
+                run_manage('loadtest_pollers', *args, env=dict(os.environ, ASYNC_VIEWS=mode))
+            return
+
+        prefix = uuid.uuid4().hex[:4]
+        rooms = [Room.objects.create(room_code=f'lp{prefix}{i}', max_player=10) for i in range(options['rooms'])]
+        clients = []
+        for i in range(options['pollers']):
+            room = rooms[i % len(rooms)]
+            player = Player.objects.create(room=room, nickname=f'p{i}')
+            clients.append((room.room_code, player.id))
+        try:
+            results = asyncio.run(self.run(clients, options))
+        finally:
+            Room.objects.filter(id__in=[room.id for room in rooms]).delete()
+        self.report(results, options)
+
+    async def run(self, clients, options):
+        app = get_asgi_application()
+        loop = asyncio.get_running_loop()
+        interval = options['interval']
+        deadline = loop.time() + options['seconds']
+        results = {'players': [], 'heartbeat': [], 'errors': 0, 'lag': []}
+
+        async def poller(room_code, player_id):
+            next_tick = loop.time() + random.uniform(0, interval)
+            heartbeat = json.dumps({'player_id': player_id, 'room_code': room_code}).encode()
+            while True:
+                await asyncio.sleep(max(0.0, next_tick - loop.time()))
+                if loop.time() >= deadline:
+                    return
+                # 落後排定時間多少：伺服器跟不上時會持續變大
+                results['lag'].append(loop.time() - next_tick)
+                for name, method, path, body in (
+                    ('heartbeat', 'POST', '/heartbeat/', heartbeat),
+                    ('players', 'GET', f'/room/{room_code}/players/', b''),
+                ):
+                    began = time.perf_counter()
+                    status = await _call(app, method, path, body)
+                    results[name].append(time.perf_counter() - began)
+                    if status != 200:
+                        results['errors'] += 1
+                next_tick += interval
+
+        await asyncio.gather(*(poller(code, pid) for code, pid in clients))
+        return results
+
+    def report(self, results, options):
+        mode = 'async' if settings.ASYNC_VIEWS else 'sync'
+        target = options['pollers'] * 2 / options['interval']
+        total = len(results['players']) + len(results['heartbeat'])
+        lag = sorted(results['lag'])
+        self.stdout.write(f'[{mode} views] {options["pollers"]} pollers, target {target:.0f} req/s, '
+                          f'achieved {total / options["seconds"]:.0f} req/s, errors {results["errors"]}')
+        for name in ('players', 'heartbeat'):
+            latencies = sorted(results[name])
+            self.stdout.write(f'  {name:<10} n={len(latencies):<7} p50 {percentile(latencies, 0.5):7.2f} ms'
+                              f'  p99 {percentile(latencies, 0.99):7.2f} ms')
+        self.stdout.write(f'  schedule lag p50 {percentile(lag, 0.5):.1f} ms, p99 {percentile(lag, 0.99):.1f} ms')
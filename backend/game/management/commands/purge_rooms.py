@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from game.purge import BATCH_SIZE, SCOPES, purge_rooms
+
+
+class Command(BaseCommand):
+    help = '分批刪除房間與其玩家：全部、未開始且閒置超過 N 秒、或已開始且超過 N 秒沒有換回合'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scope', choices=SCOPES)
+        parser.add_argument('--older-than', type=int, default=None, help='秒數（idle / started 必填）')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--pause', type=float, default=0, help='每批之間暫停幾秒，讓線上 API 取得寫入鎖')
+
+    def handle(self, *args, **options):
+        try:
+            report = purge_rooms(options['scope'], options['older_than'],
+                                 batch_size=options['batch_size'], pause_seconds=options['pause'])
+        except ValueError as e:
+            raise CommandError(e)
+        self.stdout.write(f'removed {report["rooms"]} rooms and {report["players"]} players '
+                          f'in {report["batches"]} batches ({report["seconds"]:.2f}s)')
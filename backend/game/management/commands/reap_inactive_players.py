@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from game.reaper import reap_inactive_players
+
+
+class Command(BaseCommand):
+    help = '刪除超過時間沒有心跳的玩家，並轉移房主、刪除空房間'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--timeout', type=int, default=None, help='幾秒沒心跳算離線（預設 INACTIVE_PLAYER_TIMEOUT_SECONDS）')
+        parser.add_argument('--interval', type=int, default=0, help='大於 0 時每隔幾秒重複執行')
+
+    def handle(self, *args, **options):
+        while True:
+            players, rooms = reap_inactive_players(options['timeout'])
+            self.stdout.write(f'removed {players} players, {rooms} rooms')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
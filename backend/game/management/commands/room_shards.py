@@ -0,0 +1,32 @@
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from game.models import Room
+from game.sharding import shard_for
+
+
+class Command(BaseCommand):
+    help = '列出每個節點擁有的房間數；加上 --add / --remove 可預覽節點增減時會搬動的房間'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--add', action='append', default=[], metavar='URL')
+        parser.add_argument('--remove', action='append', default=[], metavar='URL')
+
+    def handle(self, *args, **options):
+        current = list(settings.ROOM_SHARDS)
+        if not current:
+            self.stdout.write('ROOM_SHARDS is empty, sharding is disabled')
+            return
+        planned = [node for node in current if node not in options['remove']] + options['add']
+        codes = list(Room.objects.values_list('room_code', flat=True))
+        before = {code: shard_for(code, current) for code in codes}
+        after = {code: shard_for(code, planned) for code in codes}
+        for node, count in sorted(Counter(before.values()).items()):
+            self.stdout.write(f'{node}: {count} rooms')
+        if planned != current:
+            moved = [code for code in codes if before[code] != after[code]]
+            self.stdout.write(f'{len(moved)}/{len(codes)} rooms would move:')
+            for code in moved:
+                self.stdout.write(f'  {code}: {before[code]} -> {after[code]}')
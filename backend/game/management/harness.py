@@ -0,0 +1,36 @@
+"""壓力測試 / 基準測試指令（loadtest*、bench_*）共用的小工具。"""
+import functools
+import subprocess
+import sys
+
+from django.conf import settings
+from django.db import connections
+
+
+def percentile(values, q):
+    # values 需已排序（秒），回傳毫秒；沒有資料時為 0
+    return values[min(len(values) - 1, int(len(values) * q))] * 1000 if values else 0.0
+
+
+def closing_connections(func):
+    # 給背景執行緒的工作函式：結束時關閉這個執行緒開的資料庫連線
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            connections.close_all()
+    return wrapper
+
+
+def passthrough(options, names):
+    # 把目前的選項轉回命令列參數，給 --compare 以子行程重跑同一個指令
+    args = []
+    for name in names:
+        args += [f'--{name.replace("_", "-")}', str(options[name])]
+    return args
+
+
+def run_manage(*args, env=None):
+    # 以子行程執行 manage.py（不同的環境變數需要重新載入 settings）
+    subprocess.run([sys.executable, str(settings.BASE_DIR / 'manage.py'), *args], env=env, check=True)
@@ -0,0 +1,129 @@
+"""quick_join 用的候選房間：還沒開始、還有空位的房間，人最多的優先。
+
+以 heap 保存 (-人數, room_id, version)，房間有變動時直接推入新的一筆，
+舊的那筆不刪（lazy invalidation）：取出時與 _rooms 裡的最新狀態比對，不一致就丟掉。
+加入、離開、踢人、開始遊戲都會送出 room_changed / room_deleted，因此每次變動是 O(log n)，
+取最佳房間攤銷後也是 O(log n)。資料以行程為單位，其他 worker 的變動不會送到本行程，
+所以每 RELOAD_SECONDS（settings.MATCHMAKING）從資料庫整份重建一次；
+在那之前人數可能是舊的，實際能否加入由 join 在交易裡確認，失敗就換下一間。
+"""
+import heapq
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Count
+from django.dispatch import receiver
+
+from .models import Room
+from .signals import room_changed, room_deleted
+
+
+class OpenRoomQueue:
+    def __init__(self, reload_seconds=5):
+        self.reload_seconds = reload_seconds
+        self._heap = []
+        self._rooms = {}            # room_id -> (player_count, max_player, version, room_code)
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        # 第一次使用、或距離上次載入超過 reload_seconds（None 表示只載入一次）時重建
+        if self._loaded_at is not None and (
+            self.reload_seconds is None or time.monotonic() - self._loaded_at < self.reload_seconds
+        ):
+            return
+        rooms = (Room.objects.filter(started=False).annotate(player_count=Count('players'))
+                 .values_list('id', 'player_count', 'max_player', 'version', 'room_code'))
+        self._heap, self._rooms = [], {}
+        for room_id, player_count, max_player, version, room_code in rooms:
+            self._put(room_id, player_count, max_player, version, room_code)
+        self._loaded_at = time.monotonic()
+
+    def _put(self, room_id, player_count, max_player, version, room_code):
+        current = self._rooms.get(room_id)
+        if current is not None and current[2] > version:
+            return
+        # 滿的房間也記住版本（較舊的通知晚到時不會被放回去），只是不放進 heap
+        self._rooms[room_id] = (player_count, max_player, version, room_code)
+        if player_count < max_player:
+            heapq.heappush(self._heap, (-player_count, room_id, version))
+        # 過期的項目太多時重建，避免 heap 無限變大
+        if len(self._heap) > 2 * len(self._rooms) + 64:
+            self._heap = [
+                (-count, rid, ver) for rid, (count, limit, ver, _) in self._rooms.items() if count < limit
+            ]
+            heapq.heapify(self._heap)
+
+    def _is_current(self, entry):
+        current = self._rooms.get(entry[1])
+        return current is not None and current[2] == entry[2] and -entry[0] == current[0]
+
+    def player_count(self, room_id):
+        # 已知的人數（不知道則 None），給人數不變的通知沿用
+        current = self._rooms.get(room_id)
+        return current[0] if current is not None else None
+
+    def update(self, room_id, player_count, max_player, version, room_code, started):
+        with self._lock:
+            if started:
+                self._rooms.pop(room_id, None)
+            else:
+                self._put(room_id, player_count, max_player, version, room_code)
+
+    def remove(self, room_id):
+        with self._lock:
+            self._rooms.pop(room_id, None)
+
+    def best(self, exclude=()):
+        # 回傳最佳房間的 room_code（沒有則 None）；exclude 內的房間略過但保留在 heap 裡
+        with self._lock:
+            self._load()
+            skipped = []
+            try:
+                while self._heap:
+                    entry = self._heap[0]
+                    if not self._is_current(entry):
+                        heapq.heappop(self._heap)
+                        continue
+                    room_code = self._rooms[entry[1]][3]
+                    if room_code not in exclude:
+                        return room_code
+                    skipped.append(heapq.heappop(self._heap))
+                return None
+            finally:
+                for entry in skipped:
+                    heapq.heappush(self._heap, entry)
+
+
+_open_rooms = None
+_open_rooms_lock = threading.Lock()
+
+
+def get_open_rooms():
+    global _open_rooms
+    if _open_rooms is None:
+        with _open_rooms_lock:
+            if _open_rooms is None:
+                config = dict(getattr(settings, 'MATCHMAKING', {}))
+                _open_rooms = OpenRoomQueue(**{k.lower(): v for k, v in config.items()})
+    return _open_rooms
+
+
+@receiver(room_changed)
+def _room_changed(sender, room, player_count=None, **kwargs):
+    queue = get_open_rooms()
+    if room.started:
+        queue.update(room.id, 0, 0, room.version, room.room_code, started=True)
+        return
+    if player_count is None:
+        # 轉移房主、修改設定不帶人數，人數也不會變
+        player_count = queue.player_count(room.id)
+        if player_count is None:
+            player_count = room.players.count()
+    queue.update(room.id, player_count, room.max_player, room.version, room.room_code, started=False)
+
+
+@receiver(room_deleted)
+def _room_deleted(sender, room_id, **kwargs):
+    get_open_rooms().remove(room_id)
@@ -0,0 +1,223 @@
+"""每個 URL pattern 的延遲、查詢數與資料庫時間，以 Prometheus 文字格式由 /metrics/ 輸出。
+
+MetricsMiddleware 放在 MIDDLEWARE 最前面。查詢是由裝在每條資料庫連線上的
+execute_wrapper 計算（METRICS['ENABLED'] 為 False 時不安裝），透過 contextvar 歸給目前的請求，
+因此 async view 經由 sync_to_async 在其他執行緒發出的查詢也會算進去。
+統計以行程為單位，多個 worker 時由 Prometheus 分別抓取再加總。
+"""
+import bisect
+import contextvars
+import hmac
+import logging
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50)
+
+_current = contextvars.ContextVar('game_metrics_request', default=None)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RouteMetrics:
+    __slots__ = ('latency', 'queries', 'db_seconds', 'responses')
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.db_seconds = 0.0
+        self.responses = {}         # status code -> 次數
+
+
+class RequestRecord:
+    __slots__ = ('queries', 'db_seconds', 'sql')
+
+    def __init__(self, keep_sql):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.sql = [] if keep_sql else None
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._routes = {}
+        self._lock = threading.Lock()
+        self.in_flight = 0
+
+    def enter(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def record(self, route, status, seconds, record):
+        with self._lock:
+            self.in_flight -= 1
+            metrics = self._routes.get(route)
+            if metrics is None:
+                metrics = self._routes[route] = RouteMetrics()
+            metrics.latency.observe(seconds)
+            metrics.queries.observe(record.queries)
+            metrics.db_seconds += record.db_seconds
+            metrics.responses[status] = metrics.responses.get(status, 0) + 1
+
+    def render(self):
+        with self._lock:
+            routes = sorted(self._routes.items())
+            lines = [
+                '# HELP http_requests_in_flight Requests currently being handled by this process.',
+                '# TYPE http_requests_in_flight gauge',
+                f'http_requests_in_flight {self.in_flight}',
+                '# HELP http_responses_total Responses by URL pattern and status code.',
+                '# TYPE http_responses_total counter',
+            ]
+            for route, metrics in routes:
+                for status, count in sorted(metrics.responses.items()):
+                    lines.append(f'http_responses_total{{route="{_label(route)}",status="{status}"}} {count}')
+            self._render_histogram(lines, 'http_request_duration_seconds',
+                                   'Request latency by URL pattern.', routes, 'latency')
+            self._render_histogram(lines, 'db_queries_per_request',
+                                   'Database queries per request by URL pattern.', routes, 'queries')
+            lines += [
+                '# HELP db_query_seconds_total Time spent in database queries by URL pattern.',
+                '# TYPE db_query_seconds_total counter',
+            ]
+            for route, metrics in routes:
+                lines.append(f'db_query_seconds_total{{route="{_label(route)}"}} {metrics.db_seconds:.6f}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _render_histogram(lines, name, help_text, routes, attr):
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+        for route, metrics in routes:
+            histogram = getattr(metrics, attr)
+            label = _label(route)
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{route="{label}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{route="{label}"}} {histogram.sum}')
+            lines.append(f'{name}_count{{route="{label}"}} {histogram.count}')
+
+    def reset(self):
+        with self._lock:
+            self._routes = {}
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = MetricsRegistry()
+
+
+def _count_queries(execute, sql, params, many, context):
+    record = _current.get()
+    if record is None:
+        return execute(sql, params, many, context)
+    began = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - began
+        record.queries += 1
+        record.db_seconds += elapsed
+        if record.sql is not None:
+            record.sql.append((elapsed, sql))
+
+
+def _install(connection, **kwargs):
+    if _count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_queries)
+
+
+def scrape_allowed(request):
+    # /metrics/ 只給帶 Authorization: Bearer <TOKEN> 或來自 ALLOWED_IPS 的抓取者（預設兩者皆空，一律拒絕）
+    token = settings.METRICS.get('TOKEN')
+    if token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return True
+    return request.META.get('REMOTE_ADDR') in settings.METRICS.get('ALLOWED_IPS', ())
+
+
+def _slow_request_seconds():
+    value = settings.METRICS.get('SLOW_REQUEST_MS')
+    return value / 1000 if value else None
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS.get('ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_seconds = _slow_request_seconds()
+        # 只有啟用時才在連線上裝 execute_wrapper，停用時查詢完全不經過計時；
+        # 已經開啟的連線不會再觸發 connection_created
+        connection_created.connect(_install, dispatch_uid='game.metrics.install')
+        for connection in connections.all(initialized_only=True):
+            _install(connection)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        record, token, began = self.begin()
+        response = None
+        try:
+            response = self.get_response(request)
+        finally:
+            self.end(request, response, record, token, began)
+        return response
+
+    async def __acall__(self, request):
+        record, token, began = self.begin()
+        response = None
+        try:
+            response = await self.get_response(request)
+        finally:
+            self.end(request, response, record, token, began)
+        return response
+
+    def begin(self):
+        registry.enter()
+        record = RequestRecord(keep_sql=self.slow_seconds is not None)
+        return record, _current.set(record), time.perf_counter()
+
+    def end(self, request, response, record, token, began):
+        elapsed = time.perf_counter() - began
+        _current.reset(token)
+        match = getattr(request, 'resolver_match', None)
+        route = match.route if match is not None else 'unmatched'
+        status = response.status_code if response is not None else 500
+        registry.record(route, status, elapsed, record)
+        if self.slow_seconds is not None and elapsed >= self.slow_seconds:
+            logger.warning(
+                'slow request %s %s (%s) %.1f ms, %d queries, %.1f ms in db\n%s',
+                request.method, request.get_full_path(), route, elapsed * 1000,
+                record.queries, record.db_seconds * 1000,
+                '\n'.join(f'  {seconds * 1000:.2f} ms  {sql}' for seconds, sql in record.sql),
+            )
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:30
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0010_room_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='player',
+            name='last_active',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
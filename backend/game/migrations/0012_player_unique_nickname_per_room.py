@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:31
+
+from django.db import migrations, models
+from django.db.models import Count
+
+NICKNAME_MAX_LENGTH = 20
+
+
+def rename_duplicate_nicknames(apps, schema_editor):
+    # 舊版 join_room 的競爭可能留下同一房間內重複的暱稱，加上唯一限制前
+    # 保留最早加入的那位，其餘改名為「暱稱#2」「暱稱#3」…（不刪玩家）
+    Player = apps.get_model('game', 'Player')
+    duplicates = (
+        Player.objects.values('room_id', 'nickname')
+        .annotate(n=Count('id')).filter(n__gt=1)
+        .values_list('room_id', 'nickname')
+    )
+    for room_id, nickname in list(duplicates):
+        taken = set(Player.objects.filter(room_id=room_id).values_list('nickname', flat=True))
+        players = Player.objects.filter(room_id=room_id, nickname=nickname).order_by('join_time', 'id')
+        for player in list(players)[1:]:
+            n = 2
+            while True:
+                suffix = f'#{n}'
+                candidate = nickname[:NICKNAME_MAX_LENGTH - len(suffix)] + suffix
+                if candidate not in taken:
+                    break
+                n += 1
+            taken.add(candidate)
+            player.nickname = candidate
+            player.save(update_fields=['nickname'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0011_player_last_active_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(rename_duplicate_nicknames, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='player',
+            constraint=models.UniqueConstraint(fields=('room', 'nickname'), name='unique_nickname_per_room'),
+        ),
+    ]
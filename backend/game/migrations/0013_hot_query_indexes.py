@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0012_player_unique_nickname_per_room'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='room',
+            name='started',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.AddIndex(
+            model_name='player',
+            index=models.Index(fields=['room', 'join_time'], name='player_room_join_time_idx'),
+        ),
+    ]
@@ -4,7 +4,7 @@ from django.utils import timezone
 class Room(models.Model):
     room_code = models.CharField(max_length=10, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    started = models.BooleanField(default=False)
+    started = models.BooleanField(default=False, db_index=True)
     owner = models.ForeignKey('Player', null=True, blank=True, on_delete=models.SET_NULL, related_name='owned_rooms')  # 新增
     max_player = models.IntegerField(default=6)
     round_time = models.IntegerField(default=20)
@@ -12,11 +12,62 @@ class Room(models.Model):
     current_turn_index = models.IntegerField(default=0) # 輪到哪一位 (順序中的 index)
     turn_timer = models.IntegerField(default=30)        # 本回合剩餘秒數
     turn_timer_start_time = models.DateTimeField(null=True, blank=True)
+    version = models.PositiveIntegerField(default=0)   # 狀態版本，每次變動 +1
+
+    def save(self, *args, **kwargs):
+        # version 只能由 bump_version 遞增，整列 save 時不可用舊值蓋掉
+        if self.pk and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name != 'version'
+            ]
+        super().save(*args, **kwargs)
+
+    def bump_version(self):
+        # 條件式 UPDATE 遞增後在同一個交易內讀回新值（UPDATE 已取得該列的寫入鎖，不會被插隊）
+        rooms = Room.objects.filter(pk=self.pk)
+        if not rooms.update(version=models.F('version') + 1):
+            raise Room.DoesNotExist
+        self.version = rooms.values_list('version', flat=True).get()
 
 class Player(models.Model):
     room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='players')
     nickname = models.CharField(max_length=20)
     join_time = models.DateTimeField(auto_now_add=True)
-    last_active = models.DateTimeField(default=timezone.now)
+    last_active = models.DateTimeField(default=timezone.now, db_index=True)
     hand_count = models.IntegerField(default=0)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['room', 'nickname'], name='unique_nickname_per_room'),
+        ]
+        indexes = [
+            # 找最早加入的玩家（轉移房主）
+            models.Index(fields=['room', 'join_time'], name='player_room_join_time_idx'),
+        ]
+
+
+class RoomEvent(models.Model):
+    # 房間狀態變動的 journal（append-only），seq 即變動後的 Room.version
+    KINDS = [
+        ('joined', 'joined'),
+        ('left', 'left'),
+        ('kicked', 'kicked'),
+        ('reaped', 'reaped'),
+        ('owner_changed', 'owner_changed'),
+        ('started', 'started'),
+        ('turn_advanced', 'turn_advanced'),
+        ('settings_changed', 'settings_changed'),
+        ('changed', 'changed'),
+    ]
+
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='events')
+    seq = models.PositiveIntegerField()
+    kind = models.CharField(max_length=20, choices=KINDS)
+    data = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['room', 'seq'], name='unique_event_seq_per_room'),
+        ]
@@ -0,0 +1,151 @@
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+from .models import Player
+
+
+class PresenceStore:
+    """玩家在線狀態（最後心跳時間）。
+
+    心跳只寫進 store，Player.last_active 採 write-behind：
+    有待寫入的心跳超過 flush_seconds 才用一次 bulk_update 批次寫回。
+    子類別實作 _get / _set / _delete 決定資料放在哪裡。
+    """
+
+    def __init__(self, ttl_seconds=120, flush_seconds=20):
+        self.ttl_seconds = ttl_seconds
+        self.flush_seconds = flush_seconds
+        self._dirty = {}            # player_id -> 尚未寫回資料庫的心跳時間 (epoch 秒)
+        self._dirty_since = None
+        self._dirty_lock = threading.Lock()
+
+    def _get(self, player_id):
+        raise NotImplementedError
+
+    def _set(self, player_id, ts):
+        raise NotImplementedError
+
+    def _delete(self, player_id):
+        raise NotImplementedError
+
+    def touch(self, player_id, autoflush=True):
+        # 在 async view 中呼叫時傳 autoflush=False，再自行以 flush_due() 判斷並在執行緒中 flush
+        ts = time.time()
+        self._set(player_id, ts)
+        with self._dirty_lock:
+            self._dirty[player_id] = ts
+            if self._dirty_since is None:
+                self._dirty_since = ts
+        if autoflush and self.flush_due():
+            self.flush()
+
+    def flush_due(self):
+        since = self._dirty_since
+        return since is not None and time.time() - since >= self.flush_seconds
+
+    def is_known(self, player_id):
+        return self._get(player_id) is not None
+
+    def forget(self, player_id):
+        self._delete(player_id)
+        with self._dirty_lock:
+            self._dirty.pop(player_id, None)
+
+    def last_active(self, player_id, db_value):
+        # store 沒有（過期或重啟）時以資料庫的值為準
+        ts = self._get(player_id)
+        if ts is None:
+            return db_value
+        seen = datetime.fromtimestamp(ts, tz=dt_timezone.utc)
+        return max(seen, db_value) if db_value else seen
+
+    def seen_many(self, player_ids):
+        # {player_id: 最後心跳 (epoch 秒)}，store 沒有的玩家不會出現在結果裡
+        return self._get_many(player_ids)
+
+    def _get_many(self, player_ids):
+        result = {}
+        for player_id in player_ids:
+            ts = self._get(player_id)
+            if ts is not None:
+                result[player_id] = ts
+        return result
+
+    def flush(self):
+        with self._dirty_lock:
+            dirty, self._dirty, self._dirty_since = self._dirty, {}, None
+        if not dirty:
+            return 0
+        Player.objects.bulk_update(
+            [Player(id=pid, last_active=datetime.fromtimestamp(ts, tz=dt_timezone.utc))
+             for pid, ts in dirty.items()],
+            ['last_active'],
+            batch_size=500,
+        )
+        return len(dirty)
+
+
+class LocalPresenceStore(PresenceStore):
+    """單一行程內的 dict，過期項目在讀取時清掉。"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._seen = {}
+
+    def _get(self, player_id):
+        ts = self._seen.get(player_id)
+        if ts is not None and time.time() - ts > self.ttl_seconds:
+            self._seen.pop(player_id, None)
+            return None
+        return ts
+
+    def _set(self, player_id, ts):
+        self._seen[player_id] = ts
+
+    def _delete(self, player_id):
+        self._seen.pop(player_id, None)
+
+
+class CachePresenceStore(PresenceStore):
+    """放在 Django cache（例如 Redis / Memcached），多個 worker 共用。"""
+
+    def __init__(self, cache_alias='default', **kwargs):
+        super().__init__(**kwargs)
+        self.cache = caches[cache_alias]
+
+    def _key(self, player_id):
+        return f'presence:{player_id}'
+
+    def _get(self, player_id):
+        return self.cache.get(self._key(player_id))
+
+    def _get_many(self, player_ids):
+        # 一整間房的玩家只需一次 cache 往返
+        found = self.cache.get_many([self._key(pid) for pid in player_ids])
+        return {pid: found[self._key(pid)] for pid in player_ids if self._key(pid) in found}
+
+    def _set(self, player_id, ts):
+        self.cache.set(self._key(player_id), ts, timeout=self.ttl_seconds)
+
+    def _delete(self, player_id):
+        self.cache.delete(self._key(player_id))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_presence_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                config = dict(getattr(settings, 'PRESENCE_STORE', {}))
+                backend = import_string(config.pop('BACKEND', 'game.presence.LocalPresenceStore'))
+                _store = backend(**{k.lower(): v for k, v in config.items()})
+    return _store
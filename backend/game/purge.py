@@ -0,0 +1,90 @@
+import time
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Room, Player, RoomEvent
+from .presence import get_presence_store
+from .signals import notify_room_deleted
+
+BATCH_SIZE = 500
+SCOPES = ('all', 'idle', 'started')
+
+
+def _rooms_in_scope(scope, older_than_seconds):
+    rooms = Room.objects.all()
+    if scope == 'all':
+        return rooms
+    if older_than_seconds is None:
+        raise ValueError(f'scope "{scope}" requires older_than_seconds')
+    cutoff = timezone.now() - timedelta(seconds=older_than_seconds)
+    if scope == 'idle':
+        # 未開始、建立超過 X 秒且沒有任何玩家在 X 秒內有心跳（包含空房間）；
+        # 遊戲頁不送心跳，進行中的房間不看 presence，改由 'started' 判斷
+        return rooms.filter(started=False, created_at__lt=cutoff).exclude(players__last_active__gte=cutoff)
+    if scope == 'started':
+        # 已開始且 X 秒內沒有換過回合、也沒有任何房間事件（RoomEvent）
+        return (
+            rooms.filter(started=True, created_at__lt=cutoff)
+            .filter(Q(turn_timer_start_time__isnull=True) | Q(turn_timer_start_time__lt=cutoff))
+            .exclude(events__created_at__gte=cutoff)
+        )
+    raise ValueError(f'unknown scope "{scope}", expected one of {", ".join(SCOPES)}')
+
+
+def _delete_in(model, field_name, ids):
+    # DELETE FROM <table> WHERE <column> IN (...)：不經過 Collector，也不把資料列載入記憶體；
+    # ids 是一批（最多 batch_size 個），不會超過資料庫的參數上限
+    quote = connection.ops.quote_name
+    column = model._meta.get_field(field_name).column
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {quote(model._meta.db_table)} WHERE {quote(column)} IN ({placeholders})', ids)
+        return cursor.rowcount
+
+
+def purge_rooms(scope='all', older_than_seconds=None, batch_size=BATCH_SIZE, pause_seconds=0):
+    """以集合式 SQL 分批刪除房間與玩家，不把任何 Player / Room 物件載入記憶體。
+
+    scope：'all' 全部、'idle' 未開始且超過 older_than_seconds 沒有心跳、
+    'started' 已開始且超過 older_than_seconds 沒有換回合或任何房間事件。
+    每批是一個短交易（清房主 → 刪事件與玩家 → 刪房間），批與批之間可暫停 pause_seconds
+    讓線上 API 拿到寫入鎖。回傳 {'rooms', 'players', 'batches', 'seconds'}。
+    """
+    began = time.perf_counter()
+    presence = get_presence_store()
+    if scope == 'idle':
+        # 先把 presence 裡的心跳寫回，避免把還在線的房間當成閒置
+        presence.flush()
+    rooms = _rooms_in_scope(scope, older_than_seconds)
+    report = {'rooms': 0, 'players': 0, 'batches': 0}
+    last_id = 0
+    while True:
+        batch = list(rooms.filter(id__gt=last_id).order_by('id').values_list('id', 'room_code')[:batch_size])
+        if not batch:
+            break
+        last_id = batch[-1][0]
+        # 關聯（Room.owner、Player.room、RoomEvent.room）在同一個交易裡先處理掉，再直接 DELETE
+        with transaction.atomic():
+            # 交易內再確認一次，挑選之後才有人加入的房間不刪
+            batch = list(rooms.filter(id__in=[room_id for room_id, _ in batch]).values_list('id', 'room_code'))
+            room_ids = [room_id for room_id, _ in batch]
+            player_ids = []
+            if room_ids:
+                player_ids = list(Player.objects.filter(room_id__in=room_ids).values_list('id', flat=True))
+                Room.objects.filter(id__in=room_ids).update(owner=None)
+                _delete_in(RoomEvent, 'room', room_ids)
+                report['players'] += _delete_in(Player, 'room', room_ids)
+                report['rooms'] += _delete_in(Room, 'id', room_ids)
+        report['batches'] += 1
+        # 被刪玩家尚未寫回的心跳也要清掉，否則之後會對已不存在的列 flush
+        for player_id in player_ids:
+            presence.forget(player_id)
+        for room_id, room_code in batch:
+            notify_room_deleted(room_id, room_code)
+        if pause_seconds:
+            time.sleep(pause_seconds)
+    report['seconds'] = round(time.perf_counter() - began, 3)
+    return report
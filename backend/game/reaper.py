@@ -0,0 +1,107 @@
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.utils import timezone
+
+from .models import Room, Player
+from .presence import get_presence_store
+from .signals import notify_room_changed, notify_room_deleted
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+
+def _batches(items, size=BATCH_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def reap_inactive_players(timeout_seconds=None):
+    """清掉所有未開始房間中超過 timeout 沒心跳的玩家。
+
+    一次查詢找出全部候選（Player.last_active 有索引），批次刪除，
+    房主被清掉的房間改由最早加入的玩家接手，空房間一起刪除。
+    回傳 (刪除玩家數, 刪除房間數)。
+    """
+    if timeout_seconds is None:
+        timeout_seconds = getattr(settings, 'INACTIVE_PLAYER_TIMEOUT_SECONDS', 60)
+    cutoff = timezone.now() - timedelta(seconds=timeout_seconds)
+    presence = get_presence_store()
+    presence.flush()
+
+    candidates = Player.objects.filter(room__started=False, last_active__lt=cutoff)
+    inactive = [
+        (pid, room_id)
+        for pid, room_id, last_active in candidates.values_list('id', 'room_id', 'last_active')
+        if presence.last_active(pid, last_active) < cutoff
+    ]
+    player_ids = [pid for pid, _ in inactive]
+    room_ids = sorted({room_id for _, room_id in inactive})
+
+    with transaction.atomic():
+        for batch in _batches(player_ids):
+            Room.objects.filter(owner_id__in=batch).update(owner=None)
+            Player.objects.filter(id__in=batch).delete()
+        # 沒人的房間（建立超過 timeout 才算，避免刪到剛建立還沒加入玩家的房間）
+        empty_rooms = list(
+            Room.objects.filter(started=False, created_at__lt=cutoff)
+            .annotate(n=Count('players')).filter(n=0)
+            .values_list('id', 'room_code')
+        )
+        empty_ids = {room_id for room_id, _ in empty_rooms}
+        for batch in _batches(sorted(empty_ids)):
+            Room.objects.filter(id__in=batch).delete()
+        first_player = Player.objects.filter(room=OuterRef('pk')).order_by('join_time').values('id')[:1]
+        changed_ids = [room_id for room_id in room_ids if room_id not in empty_ids]
+        for batch in _batches(changed_ids):
+            Room.objects.filter(id__in=batch, owner=None).update(owner=Subquery(first_player))
+        for room_id, room_code in empty_rooms:
+            notify_room_deleted(room_id, room_code)
+        # version 與 journal 跟刪除寫在同一個交易裡，推播等提交後才送出
+        removed = {}
+        for pid, room_id in inactive:
+            removed.setdefault(room_id, []).append(pid)
+        for room in Room.objects.filter(id__in=changed_ids).annotate(player_count=Count('players')):
+            notify_room_changed(room, 'reaped', player_count=room.player_count,
+                                player_ids=removed[room.id], owner_id=room.owner_id)
+
+    for pid in player_ids:
+        presence.forget(pid)
+    return len(player_ids), len(empty_rooms)
+
+
+class InactivePlayerReaper:
+    """在背景執行緒定期呼叫 reap_inactive_players，讓讀取用的 API 不必順便清人。"""
+
+    def __init__(self):
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self._thread is not None or not getattr(settings, 'INACTIVE_REAPER_ENABLED', True):
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='inactive-reaper', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        interval = getattr(settings, 'INACTIVE_REAPER_INTERVAL_SECONDS', 10)
+        while True:
+            try:
+                reap_inactive_players()
+            except Exception:
+                logger.exception('inactive player reaper error')
+            finally:
+                close_old_connections()
+            time.sleep(interval)
+
+
+reaper = InactivePlayerReaper()
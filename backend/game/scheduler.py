@@ -0,0 +1,126 @@
+import heapq
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Room
+from .sharding import is_local
+from .signals import room_changed, room_deleted
+
+logger = logging.getLogger(__name__)
+
+
+def _turn_key(room):
+    # 同一回合的識別：輪到誰 + 這回合開始的時間 + 回合秒數
+    return (room.current_turn_index, room.turn_timer_start_time, room.round_time)
+
+
+class TurnScheduler:
+    """回合截止時間排程器。
+
+    以 heap 依 turn_timer_start_time + round_time 排序所有進行中的房間，
+    背景執行緒在截止時呼叫 advance_turn（條件式 UPDATE），
+    所以每個回合只會被推進一次，get_players 不必再寫資料庫。
+    """
+
+    def __init__(self):
+        self._heap = []          # (deadline, room_id, turn_key)
+        self._scheduled = {}     # room_id -> 目前有效的 turn_key
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None or not getattr(settings, 'TURN_SCHEDULER_ENABLED', True):
+            return
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='turn-scheduler', daemon=True)
+            self._thread.start()
+
+    def schedule(self, room):
+        # 啟用分流時只排本節點擁有的房間
+        if not (room.started and room.turn_order and room.round_time and room.round_time > 0
+                and room.turn_timer_start_time and is_local(room.room_code)):
+            self.cancel(room.id)
+            return
+        key = _turn_key(room)
+        deadline = room.turn_timer_start_time + timedelta(seconds=room.round_time)
+        with self._cond:
+            if self._scheduled.get(room.id) == key:
+                return
+            self._scheduled[room.id] = key
+            heapq.heappush(self._heap, (deadline, room.id, key))
+            if self._heap[0][1] == room.id:
+                self._cond.notify()
+        self.start()
+
+    def cancel(self, room_id):
+        # heap 裡的舊項目到期時會因 key 對不上而被略過
+        with self._cond:
+            self._scheduled.pop(room_id, None)
+
+    def resync(self):
+        # 從資料庫補回其他行程建立、或本行程重啟前的回合
+        rooms = Room.objects.filter(started=True, round_time__gt=0).exclude(turn_timer_start_time=None)
+        for room in rooms:
+            self.schedule(room)
+
+    def _next_due(self, resync_at):
+        with self._cond:
+            while True:
+                now = timezone.now()
+                if now >= resync_at:
+                    return None
+                if self._heap and self._heap[0][0] <= now:
+                    deadline, room_id, key = heapq.heappop(self._heap)
+                    if self._scheduled.get(room_id) != key:
+                        continue
+                    del self._scheduled[room_id]
+                    return room_id, key
+                wait_until = min(self._heap[0][0], resync_at) if self._heap else resync_at
+                self._cond.wait((wait_until - now).total_seconds())
+
+    def _run(self):
+        interval = timedelta(seconds=getattr(settings, 'TURN_SCHEDULER_RESYNC_SECONDS', 30))
+        resync_at = timezone.now()
+        while True:
+            try:
+                due = self._next_due(resync_at)
+                if due is None:
+                    self.resync()
+                    resync_at = timezone.now() + interval
+                else:
+                    self._expire(*due)
+            except Exception:
+                logger.exception('turn scheduler error')
+            finally:
+                close_old_connections()
+
+    def _expire(self, room_id, key):
+        from .views import advance_turn
+        room = Room.objects.filter(pk=room_id).first()
+        if room is None or _turn_key(room) != key:
+            return
+        if not advance_turn(room, expected_index=key[0], expected_start=key[1]):
+            # 其他行程已經換過人，重新排下一回合
+            room.refresh_from_db()
+            self.schedule(room)
+
+
+turn_scheduler = TurnScheduler()
+
+
+@receiver(room_changed)
+def _schedule_turn(sender, room, **kwargs):
+    turn_scheduler.schedule(room)
+
+
+@receiver(room_deleted)
+def _cancel_turn(sender, room_id, **kwargs):
+    turn_scheduler.cancel(room_id)
@@ -0,0 +1,93 @@
+"""依 room_code 把房間固定分配給某個 worker / 節點。
+
+記憶體中的狀態（engine、presence、回合排程）都是以行程為單位，
+多個 worker 時同一間房的請求必須落在同一個行程。每個 worker 以不同的網址
+啟動（例如 uvicorn 分別跑在 9001、9002…），在 ROOM_SHARDS 列出全部網址，
+並以 ROOM_SHARD_SELF 告訴每個 worker 自己是哪一個。
+
+分配使用 rendezvous hashing（HRW）：每個節點對 room_code 算分數，分數最高者擁有該房。
+新增節點時只有新節點分數最高的那些房間（約 1/N）會搬過去，其餘房間的擁有者不變；
+搬過去的房間由新擁有者從資料庫載入，舊擁有者之後只會回傳轉址。
+可用 manage.py room_shards --add <url> 預覽新增節點會搬動哪些房間。
+"""
+import hashlib
+import json
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponseRedirect
+from django.urls import Resolver404, resolve
+
+
+def _score(node, room_code):
+    digest = hashlib.blake2b(f'{node}|{room_code}'.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+def shard_for(room_code, shards=None):
+    shards = settings.ROOM_SHARDS if shards is None else shards
+    if not shards or not room_code:
+        return None
+    return max(shards, key=lambda node: _score(node, room_code))
+
+
+def is_local(room_code):
+    # 沒有啟用分流時所有房間都在本行程
+    if not settings.ROOM_SHARD_SELF:
+        return True
+    owner = shard_for(room_code)
+    return owner is None or owner == settings.ROOM_SHARD_SELF
+
+
+class HttpResponseTemporaryRedirect(HttpResponseRedirect):
+    # 307：瀏覽器會以相同的方法與 body 重送（POST 的 JSON 不會遺失）
+    status_code = 307
+
+
+def _request_room_code(request):
+    try:
+        room_code = resolve(request.path_info).kwargs.get('room_code')
+    except Resolver404:
+        return None
+    if room_code:
+        return room_code
+    if request.method == 'POST' and request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return None
+        if isinstance(data, dict):
+            return data.get('room_code')
+    return None
+
+
+class RoomShardMiddleware:
+    """房間不屬於本節點時以 307 轉到擁有者；沒有帶 room_code 的請求照常在本節點處理。"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # 同時支援同步與非同步，ASGI 下不必為了這個 middleware 切換執行緒
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self.redirect(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        return self.redirect(request) or await self.get_response(request)
+
+    def redirect(self, request):
+        if not settings.ROOM_SHARD_SELF:
+            return None
+        owner = shard_for(_request_room_code(request))
+        if owner is None or owner == settings.ROOM_SHARD_SELF:
+            return None
+        response = HttpResponseTemporaryRedirect(owner.rstrip('/') + request.get_full_path())
+        response['X-Room-Shard'] = owner
+        return response
@@ -0,0 +1,27 @@
+from django.db import transaction
+from django.dispatch import Signal
+
+# 房間狀態有變動時送出（加入、離開、踢人、轉移房主、開始遊戲、修改設定、換回合）
+# 參數：room, player_count（呼叫端已知的人數，不知道時為 None，接收者不必再查）
+room_changed = Signal()
+
+# 房間被刪除時送出
+# 參數：room_id, room_code
+room_deleted = Signal()
+
+
+def notify_room_changed(room, kind='changed', player_count=None, **data):
+    # 要在變動所在的交易裡呼叫：version 遞增與 journal（RoomEvent）跟變動一起提交或一起回滾，
+    # 事件的 seq 必定等於這次的 version；room_changed 等交易提交後才送出
+    from .models import RoomEvent
+    with transaction.atomic(savepoint=False):
+        room.bump_version()
+        RoomEvent.objects.create(room_id=room.pk, seq=room.version, kind=kind, data=data)
+    transaction.on_commit(
+        lambda: room_changed.send(sender=room.__class__, room=room, player_count=player_count)
+    )
+
+
+def notify_room_deleted(room_id, room_code):
+    from .models import Room
+    transaction.on_commit(lambda: room_deleted.send(sender=Room, room_id=room_id, room_code=room_code))
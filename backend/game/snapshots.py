@@ -0,0 +1,83 @@
+"""每間房最新一份已編碼的房間快照。
+
+同一個 (房間 id, version, 離線名單) 的內容完全相同，只在第一次被要求時
+build_room_state + 編碼一次，之後輪詢 get_players / sync 與 SSE 推播都直接送出同一份 bytes；
+一間房有幾百個觀戰者時成本和只有一個人差不多。每間房只保留最新一份，舊的自然被取代；
+其他 worker 刪除的房間不會通知本行程，因此最多保留 MAX_SNAPSHOTS 間（LRU），
+快取鍵也包含房間 id，代碼被新房間重用時不會拿到舊房間的內容。
+"""
+import threading
+from collections import OrderedDict
+
+from django.dispatch import receiver
+
+from .encoding import dumps
+from .signals import room_deleted
+from .state import build_room_state, idle_player_ids, player_rows
+
+MAX_SNAPSHOTS = 1024
+
+# room_code -> Snapshot，只存在本行程中，最近用到的在最後面
+_snapshots = OrderedDict()
+_lock = threading.Lock()
+
+
+class Snapshot:
+    __slots__ = ('key', 'state', 'body', '_event')
+
+    def __init__(self, key, state):
+        self.key = key
+        self.state = state
+        self.body = dumps({'status': 'ok', **state})
+        self._event = None
+
+    def response_body(self, poll_ms, timer):
+        # 倒數與 next_poll_ms 每次請求都可能不同，接在已編碼的 body 後面
+        # （body 是 dict 編碼的結果，一定以 } 結尾）
+        return b'%s,"timer":%s,"next_poll_ms":%d}' % (self.body[:-1], dumps(timer), poll_ms)
+
+    def sse_event(self):
+        if self._event is None:
+            self._event = sse_event('snapshot', self.body)
+        return self._event
+
+
+def sse_event(event, data):
+    if not isinstance(data, bytes):
+        data = dumps(data)
+    return b'event: %s\ndata: %s\n\n' % (event.encode(), data)
+
+
+def delta_event(previous, snapshot):
+    # 只送有變動的欄位；沒有變動時回傳 None
+    delta = {k: v for k, v in snapshot.state.items() if previous.state.get(k) != v}
+    return sse_event('delta', delta) if delta else None
+
+
+def get_snapshot(room, players=None, rows=None, idle_ids=None):
+    if rows is None:
+        rows = player_rows(room, players)
+    if idle_ids is None:
+        idle_ids = idle_player_ids(room, rows=rows)
+    key = (room.id, room.version, tuple(idle_ids))
+    with _lock:
+        snapshot = _snapshots.get(room.room_code)
+        if snapshot is not None and snapshot.key == key:
+            _snapshots.move_to_end(room.room_code)
+            return snapshot
+    # 倒數每秒都在變，不放進共用的快照（推播的前端用 deadline_ms 自己倒數，輪詢由 response_body 補上）
+    state = build_room_state(room, rows=rows, idle_ids=idle_ids)
+    del state['timer']
+    snapshot = Snapshot(key, state)
+    with _lock:
+        _snapshots[room.room_code] = snapshot
+        _snapshots.move_to_end(room.room_code)
+        while len(_snapshots) > MAX_SNAPSHOTS:
+            _snapshots.popitem(last=False)
+    return snapshot
+
+
+@receiver(room_deleted)
+def _drop_snapshot(sender, room_code, **kwargs):
+    with _lock:
+        _snapshots.pop(room_code, None)
@@ -0,0 +1,110 @@
+from django.utils import timezone
+from datetime import timedelta
+import math
+import zlib
+
+from django.conf import settings
+
+from . import metrics
+from .presence import get_presence_store
+
+# 大廳輪詢兼心跳，下一次要等上一次回應後才排（最慢 MAX_MS + 回應時間）：
+# 容許漏掉一次心跳（2 × MAX_MS）再多 2 秒餘裕才算離線，忙碌時拉長輪詢也不會讓玩家閃成離線
+IDLE_SECONDS = 2 * settings.POLL_HINTS['MAX_MS'] / 1000 + 2
+
+
+def get_current_timer(room):
+    if room.round_time == 0:
+        return None
+    if room.turn_timer_start_time and room.round_time:
+        elapsed = (timezone.now() - room.turn_timer_start_time).total_seconds()
+        timer = max(0, int(math.ceil(room.round_time - elapsed)))
+        return timer
+    return room.round_time or 0
+
+
+def turn_deadline(room):
+    # 本回合的截止時間；沒有開始計時或不限時則是 None
+    if not room.round_time or not room.turn_timer_start_time:
+        return None
+    return room.turn_timer_start_time + timedelta(seconds=room.round_time)
+
+
+def turn_deadline_ms(room):
+    deadline = turn_deadline(room)
+    return int(deadline.timestamp() * 1000) if deadline is not None else None
+
+
+def next_poll_ms(room):
+    # 建議前端下一次輪詢的間隔：回合快到期時加快、大廳放慢，
+    # 本行程同時處理的請求過多時再依比例拉長（不超過 MAX_MS，IDLE_SECONDS 由它推算）
+    hints = settings.POLL_HINTS
+    if room.started:
+        deadline = turn_deadline(room)
+        if deadline is None:
+            interval = hints['GAME_MS']
+        else:
+            ms_left = (deadline - timezone.now()).total_seconds() * 1000
+            interval = min(hints['GAME_MS'], max(hints['MIN_MS'], ms_left / 2))
+    else:
+        interval = hints['LOBBY_MS']
+    busy = metrics.registry.in_flight / hints['BUSY_IN_FLIGHT']
+    if busy > 1:
+        interval *= busy
+    return int(min(interval, hints['MAX_MS']))
+
+
+PLAYER_FIELDS = ('id', 'nickname', 'hand_count', 'last_active')
+
+
+def player_rows(room, players=None):
+    # 玩家資料的 tuple (id, nickname, hand_count, last_active)；
+    # 沒有傳入 players 時只查這四欄，不建立 Player 物件
+    if players is None:
+        return list(room.players.values_list(*PLAYER_FIELDS))
+    return [(p.id, p.nickname, getattr(p, 'hand_count', 0), p.last_active) for p in players]
+
+
+def build_room_state(room, players=None, rows=None, idle_ids=None):
+    # get_players 與推播共用的房間快照；players 可傳入已在記憶體中的玩家（engine.RoomState），
+    # 已經取得 player_rows / idle_player_ids 時可直接傳入，不會重算
+    if rows is None:
+        rows = player_rows(room, players)
+    if idle_ids is None:
+        idle_ids = idle_player_ids(room, rows=rows)
+    idle_ids = set(idle_ids)
+    return {
+        'room_code': room.room_code,
+        'version': room.version,
+        'players': [
+            {'id': pid, 'nickname': nickname, 'handCount': hand_count, 'idle': pid in idle_ids}
+            for pid, nickname, hand_count, _ in rows
+        ],
+        'started': room.started,
+        'owner_id': room.owner_id,
+        'round_time': room.round_time,
+        'turn_order': room.turn_order,
+        'current_turn_index': room.current_turn_index,
+        'timer': get_current_timer(room),  # 若不限時則是 None
+        # 回合截止的絕對時間（epoch 毫秒），前端配合 /time/ 的時間差在本地倒數；不限時則是 None
+        'deadline_ms': turn_deadline_ms(room),
+    }
+
+
+def idle_player_ids(room, players=None, rows=None):
+    if rows is None:
+        rows = player_rows(room, players)
+    cutoff = (timezone.now() - timedelta(seconds=IDLE_SECONDS)).timestamp()
+    seen = get_presence_store().seen_many([row[0] for row in rows])
+    return sorted(
+        pid for pid, _, _, last_active in rows
+        if max(seen.get(pid, 0), last_active.timestamp() if last_active else 0) < cutoff
+    )
+
+
+def room_state_etag(room, idle_ids):
+    # 房間 id + 版本號 + 離線名單；倒數不算在內，前端依 deadline_ms 在本地倒數，
+    # 回合進行中輪詢仍能拿到 304，只有真的換人、加入等變動才會不同
+    # （房間代碼刪除後可能被新房間重用，版本號會從頭算，所以要帶上 id）
+    idle_crc = zlib.crc32(','.join(map(str, idle_ids)).encode())
+    return f'W/"{room.id}-{room.version}-{idle_crc:x}"'
@@ -1,3 +1,716 @@
-from django.test import TestCase
+import asyncio
+import json
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.db import IntegrityError, connection, transaction
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import broadcast, encoding, engine, lobby, matchmaking, metrics, presence, snapshots
+from .codes import get_room_code_allocator
+from .matchmaking import OpenRoomQueue, _room_changed, get_open_rooms
+from .lobby import LocalLobbyDirectory
+from .models import Room, Player, RoomEvent
+from .presence import get_presence_store
+from .purge import purge_rooms
+from .reaper import reap_inactive_players
+from .scheduler import TurnScheduler
+from .sharding import shard_for
+from .signals import notify_room_changed, room_changed
+from .state import IDLE_SECONDS, next_poll_ms
+from .views import _join_room, advance_turn
+
+# 測試中不啟動回合排程器與離線玩家清除的背景執行緒
+no_background_threads = override_settings(TURN_SCHEDULER_ENABLED=False, INACTIVE_REAPER_ENABLED=False)
+
+
+class GameTestCase(TestCase):
+    """每個測試都從空的行程內狀態開始。
+
+    測試回滾後房間與玩家的 id 會被重用，上一個測試留在模組層級快取裡的項目
+    （版本較新）會擋住這次的更新，因此把單例與快取都換成新的。
+    """
+
+    def setUp(self):
+        super().setUp()
+        # engine 不啟動寫回心跳的背景執行緒
+        room_engine = engine.RoomEngine(revalidate_seconds=settings.GAME_ENGINE['REVALIDATE_SECONDS'],
+                                        persist_seconds=None)
+        for target, attribute, value in (
+            (engine, '_engine', room_engine),
+            (lobby, '_directory', None),
+            (matchmaking, '_open_rooms', None),
+            (presence, '_store', None),
+            (snapshots, '_snapshots', snapshots.OrderedDict()),
+            (broadcast, '_published', {}),
+        ):
+            patcher = mock.patch.object(target, attribute, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class RoomEventsTests(GameTestCase):
+    def test_wsgi_request_is_refused_instead_of_hanging(self):
+        Room.objects.create(room_code='SSE1')
+        response = self.client.get('/room/SSE1/events/')
+        self.assertEqual(response.status_code, 501)
+        self.assertEqual(response.json()['status'], 'error')
+
+
+@no_background_threads
+class RoomVersionTests(GameTestCase):
+    def test_reaping_inactive_players_invalidates_since_and_etag(self):
+        room = Room.objects.create(room_code='VER1')
+        keep = Player.objects.create(room=room, nickname='留下')
+        gone = Player.objects.create(room=room, nickname='離線')
+        room.owner = gone
+        room.save(update_fields=['owner'])
+        first = self.client.get('/room/VER1/players/')
+        version = first.json()['version']
+
+        Player.objects.filter(id=gone.id).update(last_active=timezone.now() - timedelta(minutes=5))
+        with self.captureOnCommitCallbacks(execute=True):
+            reap_inactive_players(timeout_seconds=60)
+
+        response = self.client.get(f'/room/VER1/players/?since={version}', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertNotIn('unchanged', data)
+        self.assertGreater(data['version'], version)
+        self.assertEqual([p['id'] for p in data['players']], [keep.id])
+        self.assertEqual(data['owner_id'], keep.id)
+
+
+class JoinRoomTests(GameTestCase):
+    def join(self, room_code, nickname, max_player=3):
+        body = {'nickname': nickname, 'max_player': max_player}
+        if room_code is not None:
+            body['room_code'] = room_code
+        response = self.client.post('/join/', json.dumps(body), content_type='application/json')
+        return response.json()
+
+    def test_first_player_becomes_owner(self):
+        first = self.join(None, '甲')
+        second = self.join(first['room_code'], '乙')
+        self.assertEqual(first['status'], 'ok')
+        self.assertEqual(second['status'], 'ok')
+        room = Room.objects.get(room_code=first['room_code'])
+        self.assertEqual(room.owner_id, first['player_id'])
+
+    def test_duplicate_nickname_is_rejected(self):
+        room_code = self.join(None, '甲')['room_code']
+        result = self.join(room_code, '甲')
+        self.assertEqual(result['status'], 'error')
+        self.assertEqual(Player.objects.filter(room__room_code=room_code).count(), 1)
+
+    def test_full_room_is_rejected(self):
+        room_code = self.join(None, '甲')['room_code']
+        for nickname in ('乙', '丙'):
+            self.assertEqual(self.join(room_code, nickname)['status'], 'ok')
+        result = self.join(room_code, '丁')
+        self.assertEqual(result['status'], 'error')
+        self.assertEqual(Player.objects.filter(room__room_code=room_code).count(), 3)
+
+    def test_unknown_code_does_not_create_a_room(self):
+        result = self.join('ZZZZ', '甲')
+        self.assertEqual(result, {'status': 'error', 'message': '房間不存在'})
+        self.assertFalse(Room.objects.exists())
+
+    def test_bad_nickname_does_not_create_a_room(self):
+        for nickname in (None, '', '   ', 'x' * 21, 7):
+            with self.subTest(nickname=nickname):
+                result = self.join(None, nickname)
+                self.assertEqual(result, {'status': 'error', 'message': '暱稱必須是1~20個字'})
+        self.assertFalse(Room.objects.exists())
+
+    def test_other_integrity_errors_are_not_reported_as_duplicates(self):
+        room_code = self.join(None, '甲')['room_code']
+        with mock.patch.object(Player.objects, 'create', side_effect=IntegrityError('NOT NULL')), \
+                self.assertRaises(IntegrityError):
+            _join_room(room_code, '乙', 3)
+
+    def test_racing_creators_get_different_codes(self):
+        # 另一個 worker 的 bitmap 還不知道這個代碼已被使用：INSERT 撞到 unique 後換一個代碼
+        first = self.join(None, '甲')
+        allocator = get_room_code_allocator()
+        with mock.patch.object(allocator, 'allocate', side_effect=[first['room_code'], 'ZZZZ']) as allocate:
+            second = self.join(None, '乙')
+        self.assertEqual(allocate.call_count, 2)
+        self.assertEqual((second['status'], second['room_code']), ('ok', 'ZZZZ'))
+        self.assertEqual(Room.objects.get(room_code=first['room_code']).players.count(), 1)
+        self.assertEqual(Room.objects.get(room_code='ZZZZ').owner_id, second['player_id'])
+
+
+@no_background_threads
+class NextTurnTests(GameTestCase):
+    def setUp(self):
+        super().setUp()
+        self.room = Room.objects.create(room_code='NT01', started=True, round_time=20,
+                                        turn_timer_start_time=timezone.now())
+        self.room.turn_order = [Player.objects.create(room=self.room, nickname=n).id for n in ('甲', '乙', '丙')]
+        self.room.save(update_fields=['turn_order'])
+
+    def next_turn(self, turn_index):
+        response = self.client.post('/next_turn/', json.dumps({
+            'room_code': 'NT01', 'turn_index': turn_index,
+        }), content_type='application/json')
+        return response.json()
+
+    def test_current_index_advances_once(self):
+        first = self.next_turn(0)
+        repeated = self.next_turn(0)
+        self.assertEqual((first['advanced'], first['current_turn_index']), (True, 1))
+        self.assertEqual((repeated['advanced'], repeated['current_turn_index']), (False, 1))
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.current_turn_index, 1)
+
+    def test_stale_index_does_not_advance(self):
+        Room.objects.filter(pk=self.room.pk).update(current_turn_index=2)
+        result = self.next_turn(1)
+        self.assertFalse(result['advanced'])
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.current_turn_index, 2)
+
+    def test_scheduler_loses_to_manual_advance(self):
+        # 排程器記下的是換人前的回合（index + 開始時間），手動換過之後它的 UPDATE 不會成立
+        stale = Room.objects.get(pk=self.room.pk)
+        self.assertTrue(self.next_turn(0)['advanced'])
+        self.assertFalse(advance_turn(stale, expected_index=0, expected_start=stale.turn_timer_start_time))
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.current_turn_index, 1)
+
+    def test_manual_advance_loses_to_scheduler(self):
+        self.assertTrue(advance_turn(Room.objects.get(pk=self.room.pk), expected_index=0,
+                                     expected_start=self.room.turn_timer_start_time))
+        self.assertFalse(self.next_turn(0)['advanced'])
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.current_turn_index, 1)
+
+    def test_invalid_turn_index_is_rejected(self):
+        for turn_index in ('abc', [0], 3, -1):
+            result = self.next_turn(turn_index)
+            self.assertEqual(result['status'], 'error', turn_index)
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.current_turn_index, 0)
+
+
+class MetricsViewTests(GameTestCase):
+    def test_loopback_is_not_trusted_by_default(self):
+        # 同一台機器上的反向代理轉來的請求也是 127.0.0.1
+        self.assertEqual(self.client.get('/metrics/', REMOTE_ADDR='127.0.0.1').status_code, 403)
+
+    @override_settings(METRICS={'ENABLED': True, 'ALLOWED_IPS': ['10.0.0.9'], 'TOKEN': ''})
+    def test_allowed_ips_may_scrape(self):
+        response = self.client.get('/metrics/', REMOTE_ADDR='10.0.0.9')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'http_requests_in_flight', response.content)
+        self.assertEqual(self.client.get('/metrics/', REMOTE_ADDR='127.0.0.1').status_code, 403)
+
+    @override_settings(METRICS={'ENABLED': True, 'ALLOWED_IPS': [], 'TOKEN': 'secret'})
+    def test_remote_callers_need_the_token(self):
+        self.assertEqual(self.client.get('/metrics/', REMOTE_ADDR='203.0.113.5').status_code, 403)
+        response = self.client.get('/metrics/', REMOTE_ADDR='203.0.113.5', HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get('/metrics/', REMOTE_ADDR='203.0.113.5', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+
+
+class PollHintTests(GameTestCase):
+    def test_busy_backoff_leaves_room_for_a_missed_heartbeat(self):
+        # 大廳輪詢兼心跳：最長的輪詢間隔連續兩次都還不能被判定離線
+        with mock.patch.object(metrics.registry, 'in_flight', 10_000):
+            poll_ms = next_poll_ms(Room(room_code='PH01'))
+        self.assertLess(2 * poll_ms, IDLE_SECONDS * 1000)
+
+    @no_background_threads
+    def test_only_players_shown_idle_can_be_kicked_by_anyone(self):
+        room = Room.objects.create(room_code='PH02')
+        host, online, idle = (Player.objects.create(room=room, nickname=n) for n in ('甲', '乙', '丙'))
+        room.owner = host
+        room.save(update_fields=['owner'])
+        now = timezone.now()
+        Player.objects.filter(id=online.id).update(last_active=now - timedelta(seconds=IDLE_SECONDS - 1))
+        Player.objects.filter(id=idle.id).update(last_active=now - timedelta(seconds=IDLE_SECONDS + 1))
+        players = self.client.get('/room/PH02/players/').json()['players']
+        self.assertEqual([p['id'] for p in players if p['idle']], [idle.id])
+
+        def kick(target):
+            body = {'room_code': 'PH02', 'owner_id': online.id, 'target_player_id': target.id}
+            return self.client.post('/kick_player/', json.dumps(body), content_type='application/json')
+
+        self.assertEqual(kick(online).status_code, 403)
+        self.assertEqual(kick(idle).json()['status'], 'ok')
+        self.assertFalse(Player.objects.filter(id=idle.id).exists())
+
+
+@no_background_threads
+class PurgeRoomsTests(GameTestCase):
+    def make_room(self, room_code, started=False, turn_started=None, last_active=None):
+        long_ago = timezone.now() - timedelta(hours=2)
+        room = Room.objects.create(room_code=room_code, started=started, turn_timer_start_time=turn_started)
+        Room.objects.filter(pk=room.pk).update(created_at=long_ago)
+        player = Player.objects.create(room=room, nickname='甲', last_active=last_active or long_ago)
+        room.owner = player
+        room.save(update_fields=['owner'])
+        return room, player
+
+    def test_idle_scope_keeps_games_in_progress(self):
+        # 遊戲頁不送心跳，進行中房間的 last_active 停在大廳階段
+        self.make_room('PG01', started=True, turn_started=timezone.now())
+        self.make_room('PG02')
+        report = purge_rooms('idle', 3600)
+        self.assertEqual(report['rooms'], 1)
+        self.assertEqual(list(Room.objects.values_list('room_code', flat=True)), ['PG01'])
+
+    def test_started_scope_judges_activity_by_turns_and_events(self):
+        long_ago = timezone.now() - timedelta(hours=2)
+        self.make_room('PG03', started=True, turn_started=timezone.now())
+        recent_event, _ = self.make_room('PG04', started=True, turn_started=long_ago)
+        RoomEvent.objects.create(room=recent_event, seq=1, kind='changed')
+        self.make_room('PG05', started=True, turn_started=long_ago)
+        report = purge_rooms('started', 3600)
+        self.assertEqual(report['rooms'], 1)
+        self.assertEqual(sorted(Room.objects.values_list('room_code', flat=True)), ['PG03', 'PG04'])
+
+    def test_deleted_players_are_forgotten_by_presence(self):
+        room, player = self.make_room('PG06')
+        RoomEvent.objects.create(room=room, seq=1, kind='joined')
+        store = get_presence_store()
+        store.touch(player.id, autoflush=False)
+        report = purge_rooms('all', batch_size=1)
+        self.assertEqual((report['rooms'], report['players']), (1, 1))
+        self.assertFalse(Room.objects.exists() or Player.objects.exists() or RoomEvent.objects.exists())
+        self.assertFalse(store.is_known(player.id))
+        self.assertNotIn(player.id, store._dirty)
+
+
+@no_background_threads
+class RoomJournalTests(GameTestCase):
+    def test_version_and_event_roll_back_with_the_change(self):
+        room = Room.objects.create(room_code='RJ01')
+        try:
+            with transaction.atomic():
+                room.round_time = 45
+                room.save(update_fields=['round_time'])
+                notify_room_changed(room, 'settings_changed', round_time=45)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        room.refresh_from_db()
+        self.assertEqual((room.version, room.round_time), (0, 20))
+        self.assertFalse(RoomEvent.objects.filter(room=room).exists())
+
+    def test_signal_is_sent_after_commit_with_the_new_version(self):
+        room = Room.objects.create(room_code='RJ02')
+        seen = []
+
+        def receiver(sender, room, **kwargs):
+            seen.append(room.version)
+
+        room_changed.connect(receiver)
+        try:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                with transaction.atomic():
+                    notify_room_changed(room, 'changed')
+                    self.assertEqual(seen, [])
+        finally:
+            room_changed.disconnect(receiver)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(seen, [1])
+        self.assertEqual(list(RoomEvent.objects.filter(room=room).values_list('seq', 'kind')), [(1, 'changed')])
+
+    def test_join_bumps_the_version_once_without_returning(self):
+        # Django 5.2 支援 SQLite 3.31 起，UPDATE ... RETURNING 要 3.35 才有
+        Room.objects.create(room_code='RJ03')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post('/join/', json.dumps({'room_code': 'RJ03', 'nickname': '甲'}),
+                             content_type='application/json')
+        version_updates = [q['sql'] for q in queries if '"version" = ' in q['sql'] and q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(version_updates), 1)
+        self.assertNotIn('RETURNING', version_updates[0])
+        self.assertEqual(Room.objects.get(room_code='RJ03').version, 1)
+
+    def test_bumping_a_deleted_room_raises(self):
+        room = Room.objects.create(room_code='RJ04')
+        Room.objects.filter(pk=room.pk).delete()
+        with self.assertRaises(Room.DoesNotExist), transaction.atomic():
+            room.bump_version()
+
+
+class MatchmakingTests(GameTestCase):
+    def make_room(self, room_code, player_count):
+        room = Room.objects.create(room_code=room_code, max_player=6)
+        for i in range(player_count):
+            Player.objects.create(room=room, nickname=f'玩家{i}')
+        return room
+
+    def test_rooms_from_other_workers_appear_after_reload(self):
+        queue = OpenRoomQueue(reload_seconds=5)
+        self.assertIsNone(queue.best())
+        # 其他 worker 建立 / 刪除的房間不會送出本行程的 room_changed
+        self.make_room('MM01', 2)
+        self.assertIsNone(queue.best())
+        queue._loaded_at -= 10
+        self.assertEqual(queue.best(), 'MM01')
+        Room.objects.filter(room_code='MM01').delete()
+        queue._loaded_at -= 10
+        self.assertIsNone(queue.best())
+
+    def test_signal_count_is_used_without_a_query(self):
+        room = self.make_room('MM02', 1)
+        with self.assertNumQueries(0):
+            _room_changed(Room, room=room, player_count=5)
+        self.assertEqual(get_open_rooms().player_count(room.id), 5)
+
+    @no_background_threads
+    def test_quick_join_skips_rooms_deleted_elsewhere(self):
+        with mock.patch.object(get_open_rooms(), 'best', side_effect=['GONE', None]):
+            response = self.client.post('/quick_join/', json.dumps({'nickname': '甲', 'max_player': 4}),
+                                        content_type='application/json')
+        data = response.json()
+        self.assertEqual(data['status'], 'ok')
+        self.assertNotEqual(data['room_code'], 'GONE')
+        self.assertEqual(data['max_player'], 4)
+        self.assertFalse(Room.objects.filter(room_code='GONE').exists())
+
+
+@no_background_threads
+class TimedTurnPollingTests(GameTestCase):
+    def test_countdown_alone_does_not_change_the_etag(self):
+        room = Room.objects.create(room_code='TT01', started=True, round_time=20,
+                                   turn_timer_start_time=timezone.now())
+        room.turn_order = [Player.objects.create(room=room, nickname=n).id for n in ('甲', '乙', '丙')]
+        room.save(update_fields=['turn_order'])
+        first = self.client.get('/room/TT01/players/')
+        later = timezone.now() + timedelta(seconds=3)
+        with mock.patch('game.state.timezone.now', return_value=later):
+            cached = self.client.get('/room/TT01/players/', HTTP_IF_NONE_MATCH=first['ETag'])
+            full = self.client.get('/room/TT01/players/')
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(full['ETag'], first['ETag'])
+        # 共用快照不含倒數，完整回應的 timer 是回應當下算的
+        self.assertEqual(first.json()['timer'], 20)
+        self.assertEqual(full.json()['timer'], 17)
+        self.assertEqual(full.json()['deadline_ms'], first.json()['deadline_ms'])
+
+
+@no_background_threads
+class SnapshotTests(GameTestCase):
+    def setUp(self):
+        super().setUp()
+        self.room = Room.objects.create(room_code='SN01', started=True, round_time=20,
+                                        turn_timer_start_time=timezone.now())
+        self.room.turn_order = [Player.objects.create(room=self.room, nickname=n).id for n in ('甲"乙', '丙\\丁')]
+        self.room.save(update_fields=['turn_order'])
+
+    def test_response_body_is_valid_json_with_either_encoder(self):
+        # body[:-1] 的拼接依賴編碼結果以 } 結尾，orjson 與標準庫 json 都要驗證
+        for encoder in {encoding.orjson, None}:
+            with self.subTest(orjson=encoder is not None), mock.patch.object(encoding, 'orjson', encoder):
+                snapshot = snapshots.Snapshot((0, 0, ()), {'room_code': 'SN01', 'players': [{'nickname': '甲"乙'}]})
+                for timer in (None, 17):
+                    data = json.loads(snapshot.response_body(1500, timer))
+                    self.assertEqual(data, {'status': 'ok', 'room_code': 'SN01', 'players': [{'nickname': '甲"乙'}],
+                                            'timer': timer, 'next_poll_ms': 1500})
+
+    def test_full_response_matches_the_room_state(self):
+        data = self.client.get('/room/SN01/players/').json()
+        self.assertEqual([p['nickname'] for p in data['players']], ['甲"乙', '丙\\丁'])
+        self.assertEqual(data['timer'], 20)
+        self.assertIn('next_poll_ms', data)
+
+    def test_reused_code_does_not_get_the_deleted_rooms_snapshot(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            code = self.client.post('/join/', {'nickname': 'old_player', 'max_player': 4},
+                                    content_type='application/json').json()['room_code']
+        first = self.client.get(f'/room/{code}/players/')
+        # 其他 worker 刪除房間：本行程收不到 room_deleted
+        Room.objects.filter(room_code=code).delete()
+        Room.objects.create(room_code=code, max_player=4)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/join/', {'room_code': code, 'nickname': 'new_player'},
+                             content_type='application/json')
+        data = self.client.get(f'/room/{code}/players/').json()
+        self.assertEqual([p['nickname'] for p in data['players']], ['new_player'])
+        cached = self.client.get(f'/room/{code}/players/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(cached.status_code, 200)
+
+    def test_cache_keeps_only_the_most_recently_used_rooms(self):
+        rooms = [self.room] + [Room.objects.create(room_code=f'SN0{i}') for i in (2, 3)]
+        with mock.patch.object(snapshots, 'MAX_SNAPSHOTS', 2), \
+                mock.patch.object(snapshots, '_snapshots', snapshots.OrderedDict()):
+            snapshots.get_snapshot(rooms[0])
+            snapshots.get_snapshot(rooms[1])
+            snapshots.get_snapshot(rooms[0])
+            snapshots.get_snapshot(rooms[2])
+            self.assertEqual(list(snapshots._snapshots), ['SN01', 'SN03'])
+
+    def test_last_unsubscribe_forgets_the_published_snapshot(self):
+        snapshot = snapshots.get_snapshot(self.room)
+
+        async def subscribe_and_leave():
+            subscription = broadcast.subscribe('SN01')
+            broadcast._published['SN01'] = snapshot
+            broadcast.unsubscribe(subscription)
+
+        asyncio.run(subscribe_and_leave())
+        self.assertNotIn('SN01', broadcast._published)
+
+
+class RoomEngineTests(GameTestCase):
+    def setUp(self):
+        super().setUp()
+        # 每次 get 都比對 version，不啟動寫回 presence 的背景執行緒
+        self.engine = engine.RoomEngine(revalidate_seconds=0, persist_seconds=0)
+
+    def test_reused_code_replaces_the_deleted_room(self):
+        old = Room.objects.create(room_code='EN01', version=5)
+        Player.objects.create(room=old, nickname='old_player')
+        self.engine.get('EN01')
+        Room.objects.filter(pk=old.pk).delete()
+        new = Room.objects.create(room_code='EN01', version=1)
+        Player.objects.create(room=new, nickname='new_player')
+        state = self.engine.get('EN01')
+        self.assertEqual(state.id, new.id)
+        self.assertEqual([p.nickname for p in state.player_list], ['new_player'])
+        # 新房間已存入快取，之後只需比對 version
+        with self.assertNumQueries(1):
+            self.assertIs(self.engine.get('EN01'), state)
+
+    def test_older_version_of_the_same_room_is_not_stored(self):
+        room = Room.objects.create(room_code='EN02', version=3)
+        state = self.engine.load(room)
+        room.version = 2
+        self.engine.load(room)
+        self.assertIs(self.engine._rooms['EN02'], state)
+
+    def test_prune_drops_rooms_deleted_elsewhere(self):
+        kept = Room.objects.create(room_code='EN03')
+        gone = Room.objects.create(room_code='EN04')
+        self.engine.load(kept)
+        self.engine.load(gone)
+        Room.objects.filter(pk=gone.pk).delete()
+        self.engine.prune()
+        self.assertTrue(self.engine.has('EN03'))
+        self.assertFalse(self.engine.has('EN04'))
+
+
+@no_background_threads
+class LobbyDirectoryTests(GameTestCase):
+    def post(self, path, **body):
+        with self.captureOnCommitCallbacks(execute=True):
+            data = self.client.post(path, json.dumps(body), content_type='application/json').json()
+        self.assertEqual(data['status'], 'ok', data)
+        return data
+
+    def assert_lobby_matches_db(self):
+        expected = [
+            {'room_code': room.room_code, 'player_count': room.players.count(), 'max_player': room.max_player}
+            for room in Room.objects.filter(started=False).order_by('id')
+        ]
+        # 載入後只靠通知逐間更新，讀取不必查資料庫
+        with self.assertNumQueries(0):
+            rooms = self.client.get('/rooms/').json()['rooms']
+        self.assertEqual(rooms, expected)
+
+    def test_lobby_follows_every_kind_of_change(self):
+        self.client.get('/rooms/')
+        host = self.post('/join/', nickname='甲', max_player=4)
+        code = host['room_code']
+        self.assert_lobby_matches_db()
+        second = self.post('/join/', room_code=code, nickname='乙')
+        third = self.post('/join/', room_code=code, nickname='丙')
+        self.assert_lobby_matches_db()
+        self.post('/leave/', player_id=third['player_id'])
+        self.assert_lobby_matches_db()
+        self.post('/kick_player/', room_code=code, target_player_id=second['player_id'], owner_id=host['player_id'])
+        self.assert_lobby_matches_db()
+        new_owner = self.post('/join/', room_code=code, nickname='丁')
+        self.post('/join/', room_code=code, nickname='戊')
+        self.post('/transfer_owner/', room_code=code, owner_id=host['player_id'],
+                  new_owner_id=new_owner['player_id'])
+        self.assert_lobby_matches_db()
+        other = self.post('/join/', nickname='己', max_player=3)['room_code']
+        self.post('/start/', room_code=code)
+        self.assert_lobby_matches_db()
+        self.post('/admin_delete_room/', room_code=other, admin_password=settings.ADMIN_PASSWORD)
+        self.assert_lobby_matches_db()
+
+    def test_lobby_follows_a_reap(self):
+        self.client.get('/rooms/')
+        kept = self.post('/join/', nickname='甲', max_player=4)['room_code']
+        self.post('/join/', room_code=kept, nickname='乙')
+        gone = self.post('/join/', nickname='丙', max_player=4)['room_code']
+        long_ago = timezone.now() - timedelta(hours=1)
+        Room.objects.filter(room_code=gone).update(created_at=long_ago)
+        Player.objects.filter(nickname__in=['乙', '丙']).update(last_active=long_ago)
+        with self.captureOnCommitCallbacks(execute=True):
+            reap_inactive_players(timeout_seconds=60)
+        self.assertEqual(list(Room.objects.values_list('room_code', flat=True)), [kept])
+        self.assert_lobby_matches_db()
+
+    def test_older_version_does_not_overwrite_a_newer_entry(self):
+        directory = LocalLobbyDirectory()
+        room = Room.objects.create(room_code='LD01', version=3)
+        directory.rooms()
+        stale = Room.objects.get(pk=room.pk)
+        stale.version = 2
+        directory.room_changed(room, player_count=2)
+        directory.room_changed(stale, player_count=1)
+        self.assertEqual(directory.rooms()[0][1]['player_count'], 2)
+
+    def test_rooms_from_other_workers_appear_after_reload(self):
+        directory = LocalLobbyDirectory(reload_seconds=5)
+        self.assertEqual(directory.rooms(), [])
+        # 其他 worker 建立的房間不會送出本行程的 room_changed
+        room = Room.objects.create(room_code='LD02')
+        self.assertEqual(directory.cached_rooms(), [])
+        directory._loaded_at -= 10
+        self.assertIsNone(directory.cached_rooms())
+        self.assertEqual([entry['room_code'] for _, entry in directory.rooms()], ['LD02'])
+        Room.objects.filter(pk=room.pk).delete()
+        directory._loaded_at -= 10
+        self.assertEqual(directory.rooms(), [])
+
+
+SHARDS = ['http://node-a:9001', 'http://node-b:9002', 'http://node-c:9003']
+
+
+@no_background_threads
+@override_settings(ROOM_SHARDS=SHARDS, ROOM_SHARD_SELF=SHARDS[0])
+class RoomShardTests(GameTestCase):
+    def code_owned_by(self, node):
+        return next(code for code in (f'S{i:03d}' for i in range(1000)) if shard_for(code) == node)
+
+    def test_adding_a_node_only_moves_rooms_to_it(self):
+        codes = [f'R{i:04d}' for i in range(2000)]
+        before = {code: shard_for(code, SHARDS) for code in codes}
+        after = {code: shard_for(code, SHARDS + ['http://node-d:9004']) for code in codes}
+        moved = [code for code in codes if before[code] != after[code]]
+        self.assertTrue(all(after[code] == 'http://node-d:9004' for code in moved))
+        # 約 1/N（N=4）的房間搬到新節點
+        self.assertAlmostEqual(len(moved) / len(codes), 1 / 4, delta=0.05)
+
+    def test_room_code_in_url_is_redirected_to_its_owner(self):
+        code = self.code_owned_by(SHARDS[1])
+        response = self.client.get(f'/room/{code}/players/?since=3')
+        self.assertEqual(response.status_code, 307)
+        self.assertEqual(response['Location'], f'{SHARDS[1]}/room/{code}/players/?since=3')
+        self.assertEqual(response['X-Room-Shard'], SHARDS[1])
+
+    def test_room_code_in_json_body_is_redirected_to_its_owner(self):
+        code = self.code_owned_by(SHARDS[2])
+        response = self.client.post('/next_turn/', json.dumps({'room_code': code}), content_type='application/json')
+        self.assertEqual(response.status_code, 307)
+        self.assertEqual(response['Location'], f'{SHARDS[2]}/next_turn/')
+
+    def test_local_rooms_and_requests_without_a_room_are_served_here(self):
+        code = self.code_owned_by(SHARDS[0])
+        Room.objects.create(room_code=code)
+        self.assertEqual(self.client.get(f'/room/{code}/players/').status_code, 200)
+        self.assertEqual(self.client.get('/rooms/').status_code, 200)
+
+    @override_settings(ROOM_SHARD_SELF='')
+    def test_nothing_is_redirected_without_shard_self(self):
+        code = self.code_owned_by(SHARDS[1])
+        Room.objects.create(room_code=code)
+        self.assertEqual(self.client.get(f'/room/{code}/players/').status_code, 200)
+        response = self.client.post('/next_turn/', json.dumps({'room_code': code}), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+
+@no_background_threads
+class RoomSyncTests(GameTestCase):
+    def setUp(self):
+        super().setUp()
+        self.room = Room.objects.create(room_code='SY01')
+        self.player = Player.objects.create(room=self.room, nickname='甲')
+        other = Room.objects.create(room_code='SY02')
+        self.stranger = Player.objects.create(room=other, nickname='乙')
+
+    def sync(self, player_id, query=''):
+        return self.client.post(f'/room/SY01/sync/{query}', json.dumps({'player_id': player_id}),
+                                content_type='application/json')
+
+    def test_member_heartbeat_needs_no_player_query(self):
+        self.client.get('/room/SY01/players/')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.sync(str(self.player.id))
+        self.assertEqual(response.json()['status'], 'ok')
+        self.assertFalse([q['sql'] for q in queries if 'game_player' in q['sql']])
+        self.assertTrue(get_presence_store().is_known(self.player.id))
+
+    def test_non_members_and_malformed_ids_are_ignored(self):
+        for player_id in (self.stranger.id, 'abc', None, [1]):
+            with self.subTest(player_id=player_id):
+                self.assertEqual(self.sync(player_id).json()['status'], 'ok')
+        self.assertFalse(get_presence_store().is_known(self.stranger.id))
+        self.assertEqual(get_presence_store()._dirty, {})
+
+    def test_since_current_version_returns_the_unchanged_body(self):
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            notify_room_changed(self.room, 'changed')
+        data = self.sync(self.player.id, f'?since={self.room.version}').json()
+        self.assertEqual(data['unchanged'], True)
+        self.assertEqual(data['version'], self.room.version)
+        self.assertEqual(data['idle_ids'], [])
+        self.assertNotIn('players', data)
+        self.assertIn('next_poll_ms', data)
+
+
+@no_background_threads
+class TurnSchedulerTests(GameTestCase):
+    def setUp(self):
+        super().setUp()
+        # 不啟動背景執行緒，直接呼叫 _next_due / _expire
+        self.scheduler = TurnScheduler()
+        self.room = Room.objects.create(room_code='TS01', started=True, round_time=20,
+                                        turn_timer_start_time=timezone.now() - timedelta(seconds=30))
+        self.room.turn_order = [Player.objects.create(room=self.room, nickname=n).id for n in ('甲', '乙', '丙')]
+        self.room.save(update_fields=['turn_order'])
+
+    def next_due(self):
+        # 沒有到期的回合時很快回傳 None（當作到了 resync 的時間）
+        return self.scheduler._next_due(timezone.now() + timedelta(milliseconds=50))
+
+    def test_expired_turn_is_due_once(self):
+        self.scheduler.schedule(self.room)
+        self.scheduler.schedule(self.room)
+        self.assertEqual(self.next_due(), (self.room.id, (0, self.room.turn_timer_start_time, 20)))
+        self.assertIsNone(self.next_due())
+
+    def test_cancelled_turn_is_never_due(self):
+        self.scheduler.schedule(self.room)
+        self.scheduler.cancel(self.room.id)
+        self.assertIsNone(self.next_due())
+        self.assertEqual(self.scheduler._heap, [])
+
+    def test_manual_advance_leaves_a_stale_entry_that_is_skipped(self):
+        self.scheduler.schedule(self.room)
+        self.assertTrue(advance_turn(self.room))
+        self.scheduler.schedule(self.room)
+        self.assertEqual(len(self.scheduler._heap), 2)
+        # 舊回合的項目被丟掉，新回合 20 秒後才到期
+        self.assertIsNone(self.next_due())
+        self.assertEqual([entry[1:] for entry in self.scheduler._heap],
+                         [(self.room.id, (1, self.room.turn_timer_start_time, 20))])
+
+    def test_expire_advances_exactly_once(self):
+        self.scheduler.schedule(self.room)
+        due = self.next_due()
+        self.scheduler._expire(*due)
+        self.scheduler._expire(*due)
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.current_turn_index, 1)
+        self.assertEqual(self.room.version, 1)
+
+    def test_expire_after_a_manual_advance_does_not_advance_again(self):
+        self.scheduler.schedule(self.room)
+        due = self.next_due()
+        self.assertTrue(advance_turn(Room.objects.get(pk=self.room.pk)))
+        self.scheduler._expire(*due)
+        self.room.refresh_from_db()
+        self.assertEqual((self.room.current_turn_index, self.room.version), (1, 1))
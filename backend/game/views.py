@@ -1,103 +1,294 @@
 from django.views.decorators.csrf import csrf_exempt
-from django.http import JsonResponse
+from django.views.decorators.gzip import gzip_page
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse, HttpResponseNotModified
+from asgiref.sync import sync_to_async
+import asyncio
 import json
 import random
-from .models import Room, Player
+import time
+from .models import Room, Player, RoomEvent
+from .state import (
+    get_current_timer, build_room_state, idle_player_ids, room_state_etag, next_poll_ms,
+    player_rows, PLAYER_FIELDS, IDLE_SECONDS,
+)
+from .encoding import FastJsonResponse
+from .snapshots import get_snapshot, sse_event, delta_event
+from .signals import notify_room_changed, notify_room_deleted
+from . import broadcast
+from .scheduler import turn_scheduler
+from .presence import get_presence_store
+from .reaper import reaper
+from .purge import purge_rooms
+from .lobby import get_lobby_directory
+from .codes import get_room_code_allocator
+from .matchmaking import get_open_rooms
+from .engine import get_room_engine
+from . import metrics
 from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
 from django.utils import timezone
 from datetime import timedelta
-import math
 
-def get_current_timer(room):
-    if room.round_time == 0:
-        return None
-    if room.turn_timer_start_time and room.round_time:
-        elapsed = (timezone.now() - room.turn_timer_start_time).total_seconds()
-        timer = max(0, int(math.ceil(room.round_time - elapsed)))
-        return timer
-    return room.round_time or 0
-
-def advance_turn(room):
-    if room.turn_order and len(room.turn_order) > 0:
-        room.current_turn_index = (room.current_turn_index + 1) % len(room.turn_order)
+def advance_turn(room, expected_index=None, expected_start=None):
+    # 以單一條件式 UPDATE 換人（compare-and-swap）：只有目前回合仍是 expected_index
+    # （排程器另外比對回合開始時間）時才會更新，重複或過期的請求不會多換一次。
+    # 回傳是否有換人
+    if not room.turn_order:
+        return False
+    if expected_index is None:
+        expected_index = room.current_turn_index
+    turn_count = len(room.turn_order)
+    now = timezone.now()
+    rooms = Room.objects.filter(pk=room.pk, started=True, current_turn_index=expected_index)
+    if expected_start is not None:
+        rooms = rooms.filter(turn_timer_start_time=expected_start)
+    with transaction.atomic():
+        updated = rooms.update(
+            current_turn_index=(F('current_turn_index') + 1) % turn_count,
+            turn_timer=F('round_time'),
+            turn_timer_start_time=now,
+        )
+        if not updated:
+            return False
+        room.current_turn_index = (expected_index + 1) % turn_count
         room.turn_timer = room.round_time
-        room.turn_timer_start_time = timezone.now()
-        room.save()
-
-@csrf_exempt
-def join_room(request):
-    if request.method == 'POST':
-        data = json.loads(request.body)
-        room_code = data.get('room_code')
-        nickname = data.get('nickname')
-        max_player = int(data.get('max_player', 6))
-
+        room.turn_timer_start_time = now
+        notify_room_changed(room, 'turn_advanced', current_turn_index=room.current_turn_index)
+    return True
+
+def _create_room_with_allocated_code(max_player):
+    # 各 worker 的 bitmap 可能不同步，代碼撞到時由資料庫的 unique 擋下，換一個再試
+    allocator = get_room_code_allocator()
+    for _ in range(10):
+        room_code = allocator.allocate()
         try:
-            room = Room.objects.get(room_code=room_code)
-            if room.started:
-                return JsonResponse({'status': 'error', 'message': '該房間遊戲已開始'})
-        except Room.DoesNotExist:
+            with transaction.atomic():
+                return Room.objects.create(room_code=room_code, max_player=max_player)
+        except IntegrityError:
+            continue
+    raise IntegrityError('could not allocate a room code')
+
+NICKNAME_MAX_LENGTH = Player._meta.get_field('nickname').max_length
+
+def _join_room(room_code, nickname, max_player):
+    # join_room 與 quick_join 共用，回傳回應的 dict；room_code 為空時建立新房間，
+    # 房間只能這樣建立（代碼由伺服器分配，game/codes.py），指定的代碼不存在就是錯誤
+    # 整段在同一個交易裡並鎖住房間列（SQLite 以 BEGIN IMMEDIATE 取得寫入鎖），
+    # 檢查暱稱、人數與新增玩家之間不會有其他人插隊
+    # 暱稱先檢查，不合格時不會分配代碼、建立空房間
+    if not isinstance(nickname, str) or not nickname.strip() or len(nickname) > NICKNAME_MAX_LENGTH:
+        return {'status': 'error', 'message': f'暱稱必須是1~{NICKNAME_MAX_LENGTH}個字'}
+    with transaction.atomic():
+        if not room_code:
             if not (3 <= max_player <= 10):
-                return JsonResponse({'status': 'error', 'message': '人數必須在3~10人之間'})
-            room = Room.objects.create(room_code=room_code, max_player=max_player)
-            room.save()
+                return {'status': 'error', 'message': '人數必須在3~10人之間'}
+            room = _create_room_with_allocated_code(max_player)
+        else:
+            try:
+                room = Room.objects.select_for_update().get(room_code=room_code)
+            except Room.DoesNotExist:
+                return {'status': 'error', 'message': '房間不存在'}
+        if room.started:
+            return {'status': 'error', 'message': '該房間遊戲已開始'}
 
         if Player.objects.filter(room=room, nickname=nickname).exists():
-            return JsonResponse({'status': 'error', 'message': '該房間已有相同暱稱玩家，請換一個暱稱'})
+            return {'status': 'error', 'message': '該房間已有相同暱稱玩家，請換一個暱稱'}
 
-        if room.players.count() >= room.max_player:
-            return JsonResponse({'status': 'error', 'message': '房間人數已滿，無法加入'})
+        player_count = room.players.count()
+        if player_count >= room.max_player:
+            return {'status': 'error', 'message': '房間人數已滿，無法加入'}
 
-        player = Player.objects.create(room=room, nickname=nickname)
-        if room.owner is None:
+        try:
+            with transaction.atomic():
+                player = Player.objects.create(room=room, nickname=nickname)
+        except IntegrityError:
+            # 只有 unique_nickname_per_room 擋下的才是暱稱重複，其他錯誤照常拋出
+            if not Player.objects.filter(room=room, nickname=nickname).exists():
+                raise
+            return {'status': 'error', 'message': '該房間已有相同暱稱玩家，請換一個暱稱'}
+        if room.owner_id is None:
             room.owner = player
-            room.save()
+            room.save(update_fields=['owner'])
+        notify_room_changed(room, 'joined', player_count=player_count + 1,
+                            player_id=player.id, nickname=nickname, owner_id=room.owner_id)
 
-        return JsonResponse({
-            'status': 'ok',
-            'player_id': player.id,
-            'room_code': room.room_code,
-            'max_player': room.max_player,
-        })
+    return {
+        'status': 'ok',
+        'player_id': player.id,
+        'room_code': room.room_code,
+        'max_player': room.max_player,
+    }
+
+@csrf_exempt
+def join_room(request):
+    if request.method == 'POST':
+        data = json.loads(request.body)
+        return JsonResponse(_join_room(data.get('room_code'), data.get('nickname'), int(data.get('max_player', 6))))
+
+@csrf_exempt
+def quick_join(request):
+    # 自動配對：加入還有空位且人最多的房間，沒有可加入的房間就建立一間（body {nickname, max_player}）
+    # 候選房間來自 matchmaking.open_rooms（heap），真正能否加入仍由 _join_room 在交易內確認
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Only POST allowed'})
+    data = json.loads(request.body)
+    nickname = data.get('nickname')
+    max_player = int(data.get('max_player', 6))
+    tried = set()
+    for _ in range(5):
+        room_code = get_open_rooms().best(exclude=tried)
+        if room_code is None:
+            break
+        result = _join_room(room_code, nickname, max_player)
+        if result['status'] == 'ok':
+            return JsonResponse(result)
+        # 剛好滿了、開始了、暱稱重複或已被其他 worker 刪除，換下一間
+        tried.add(room_code)
+    return JsonResponse(_join_room(None, nickname, max_player))
+
+def _get_room(room_code):
+    # 啟用 GAME_ENGINE 時從記憶體讀取房間與玩家，不經過 ORM；回傳 (room, players 或 None)
+    engine = get_room_engine()
+    if engine is None:
+        return Room.objects.get(room_code=room_code), None
+    room = engine.get(room_code)
+    if room is None:
+        raise Room.DoesNotExist
+    return room, room.player_list
 
 def get_players(request, room_code):
     try:
-        room = Room.objects.get(room_code=room_code)
-        clean_inactive_players(room, timeout_seconds=60)
-        if not Room.objects.filter(id=room.id).exists():
-            return JsonResponse({'status': 'error', 'message': '房間已關閉或沒人'}, status=404)
-        players = []
-        now = timezone.now()
-        for p in room.players.all():
-            idle = (now - p.last_active) > timedelta(seconds=5)
-            players.append({
-                'id': p.id,
-                'nickname': p.nickname,
-                'handCount': getattr(p, 'hand_count', 0),
-                'idle': idle,
-            })
-        timer = get_current_timer(room)
-        # =========== ⏰ 不限時則不自動換人！ =============
-        if (
-            room.started and room.turn_order and room.round_time and 
-            timer == 0 and room.round_time > 0
-        ):
-            advance_turn(room)
-            timer = get_current_timer(room)
-        return JsonResponse({
+        room, players = _get_room(room_code)
+        return room_state_response(request, room, players)
+    except Room.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': '房間不存在'})
+
+@csrf_exempt
+def room_sync(request, room_code):
+    # 心跳 + 房間狀態合併成一個請求：POST /room/<room_code>/sync/?since=<version>，body {player_id}
+    # 玩家是否在房間裡直接看已取得的玩家列表，不必再查 Player，心跳只寫 presence store
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Only POST allowed'})
+    data = json.loads(request.body or b'{}')
+    try:
+        room, players = _get_room(room_code)
+    except Room.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': '房間不存在'})
+    if players is None:
+        players = list(room.players.all())
+    touch_if_member(players, data.get('player_id'))
+    return room_state_response(request, room, players)
+
+def touch_if_member(players, player_id, autoflush=True):
+    try:
+        player_id = int(player_id)
+    except (TypeError, ValueError):
+        return
+    if any(p.id == player_id for p in players):
+        get_presence_store().touch(player_id, autoflush=autoflush)
+
+def room_state_response(request, room, players=None):
+    # get_players（同步與非同步版本）共用；不會查資料庫的只有傳入 players 時
+    # 回合到期由 scheduler.turn_scheduler 換人、離線玩家由 reaper 清除，這裡只負責讀取
+    turn_scheduler.start()
+    reaper.start()
+    # 條件式 GET：If-None-Match 命中回 304；?since=<version> 命中只回倒數與離線名單
+    # next_poll_ms 是下一次輪詢的建議間隔，304 時放在 X-Next-Poll-Ms 標頭
+    rows = player_rows(room, players)
+    idle_ids = idle_player_ids(room, rows=rows)
+    etag = room_state_etag(room, idle_ids)
+    poll_ms = next_poll_ms(room)
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    elif request.GET.get('since') == str(room.version):
+        response = FastJsonResponse({
             'status': 'ok',
-            'room_code': room_code,
-            'players': players,
-            'started': room.started,
-            'owner_id': room.owner.id if room.owner else None,
-            'round_time': room.round_time,
-            'turn_order': room.turn_order,
-            'current_turn_index': room.current_turn_index,
-            'timer': timer,  # 若不限時則是 None
+            'unchanged': True,
+            'version': room.version,
+            'timer': get_current_timer(room),
+            'idle_ids': idle_ids,
+            'next_poll_ms': poll_ms,
         })
+    else:
+        # 同一份狀態只編碼一次（game/snapshots.py），每個輪詢者拿到的是同一份 bytes
+        snapshot = get_snapshot(room, rows=rows, idle_ids=idle_ids)
+        response = HttpResponse(snapshot.response_body(poll_ms, get_current_timer(room)),
+                                content_type='application/json')
+    response['ETag'] = etag
+    response['X-Next-Poll-Ms'] = poll_ms
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+async def room_events(request, room_code):
+    # Server-Sent Events：房間狀態有變動時才推送，需用 ASGI (backend/asgi.py) 部署
+    # 第一筆送完整快照，之後只送有變動的欄位；前端連不上時退回輪詢 get_players
+    if not isinstance(request, ASGIRequest):
+        # WSGI / runserver 會把整個串流緩衝起來，連線只會卡住而不會出錯，直接回錯誤讓前端改用輪詢
+        return JsonResponse({'status': 'error', 'message': '推播需以 ASGI 部署，請改用輪詢'}, status=501)
+
+    async def stream():
+        subscription = broadcast.subscribe(room_code)
+        try:
+            room = await Room.objects.filter(room_code=room_code).afirst()
+            if room is None:
+                yield sse_event('closed', {'message': '房間不存在'})
+                return
+            last = await sync_to_async(get_snapshot)(room)
+            yield last.sse_event()
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscription.queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+                    continue
+                if message['type'] == 'closed':
+                    yield sse_event('closed', {'message': '房間已關閉或沒人'})
+                    return
+                snapshot, previous = message['snapshot'], message['previous']
+                # 和其他訂閱者的上一份相同時直接用推播端編碼好的 delta
+                if previous is not None and previous.key == last.key:
+                    event = message['delta']
+                else:
+                    event = delta_event(last, snapshot)
+                if event:
+                    yield event
+                last = snapshot
+        finally:
+            broadcast.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+    
+def room_journal(request, room_code):
+    # 補齊某個版本之後的變動：GET /room/<room_code>/journal/?since=N
+    # events 依 seq 排序，每次最多 JOURNAL_PAGE 筆（more=True 時以最後一筆的 seq 再查）；
+    # since 之後的事件已被 compact_room_events 清掉時回 reset=True，請改抓完整狀態
+    since = _int_param(request, 'since') or 0
+    try:
+        room, _ = _get_room(room_code)
     except Room.DoesNotExist:
         return JsonResponse({'status': 'error', 'message': '房間不存在'})
-    
+    page_size = settings.ROOM_JOURNAL['PAGE_SIZE']
+    events = []
+    if since < room.version:
+        events = list(
+            RoomEvent.objects.filter(room_id=room.id, seq__gt=since).order_by('seq')
+            .values('seq', 'kind', 'data', 'created_at')[:page_size + 1]
+        )
+        if not events or events[0]['seq'] != since + 1:
+            return FastJsonResponse({'status': 'ok', 'version': room.version, 'reset': True, 'events': []})
+    return FastJsonResponse({
+        'status': 'ok',
+        'version': room.version,
+        'reset': False,
+        'events': events[:page_size],
+        'more': len(events) > page_size,
+    })
+
 @csrf_exempt
 def leave_room(request):
     if request.method == 'POST':
@@ -111,14 +302,22 @@ def leave_room(request):
         room = player.room
         is_owner = (room.owner_id == player.id)
 
-        player.delete()
+        player_id = player.id
+        get_presence_store().forget(player_id)
+        with transaction.atomic():
+            player.delete()
 
-        if room.players.count() == 0:
-            room.delete()
-        elif is_owner:
-            new_owner = room.players.order_by('join_time').first()
-            room.owner = new_owner
-            room.save()
+            player_count = room.players.count()
+            if player_count == 0:
+                room_id, room_code = room.id, room.room_code
+                room.delete()
+                notify_room_deleted(room_id, room_code)
+                return JsonResponse({'status': 'ok'})
+            elif is_owner:
+                new_owner = room.players.order_by('join_time').first()
+                room.owner = new_owner
+                room.save(update_fields=['owner'])
+            notify_room_changed(room, 'left', player_count=player_count, player_id=player_id, owner_id=room.owner_id)
 
         return JsonResponse({'status': 'ok'})
 
@@ -139,7 +338,11 @@ def start_game(request):
             room.turn_timer = room.round_time
             room.turn_timer_start_time = timezone.now()
             room.started = True
-            room.save()
+            with transaction.atomic():
+                room.save(update_fields=[
+                    'turn_order', 'current_turn_index', 'turn_timer', 'turn_timer_start_time', 'started',
+                ])
+                notify_room_changed(room, 'started', player_count=player_count, turn_order=player_ids)
             return JsonResponse({'status': 'ok', 'turn_order': player_ids})
         except Room.DoesNotExist:
             return JsonResponse({'status': 'error', 'message': '房間不存在'})
@@ -150,31 +353,72 @@ def next_turn(request):
     if request.method == 'POST':
         data = json.loads(request.body)
         room_code = data.get('room_code')
+        # turn_index：要結束的是第幾回合，重送的請求因為回合已換過而不會生效
+        turn_index = data.get('turn_index')
+        if turn_index is not None:
+            try:
+                turn_index = int(turn_index)
+            except (TypeError, ValueError):
+                return JsonResponse({'status': 'error', 'message': 'turn_index 必須是整數'})
         try:
             room = Room.objects.get(room_code=room_code)
-            advance_turn(room)
-            return JsonResponse({'status': 'ok'})
+            if turn_index is not None and not 0 <= turn_index < len(room.turn_order):
+                return JsonResponse({'status': 'error', 'message': 'turn_index 超出範圍'})
+            advanced = advance_turn(room, expected_index=turn_index)
+            return JsonResponse({
+                'status': 'ok',
+                'advanced': advanced,
+                'current_turn_index': room.current_turn_index,
+            })
         except Room.DoesNotExist:
             return JsonResponse({'status': 'error', 'message': '房間不存在'})
 
+def _int_param(request, name):
+    try:
+        return int(request.GET[name])
+    except (KeyError, ValueError):
+        return None
+
+def _room_page(request, rooms, fields, descending=False):
+    # 一次查詢帶出人數；選用參數：
+    #   ?has_seats=1                只列還有空位的房間
+    #   ?limit=N&cursor=<next_cursor> 依 id 分頁
+    rooms = rooms.annotate(player_count=Count('players'))
+    if request.GET.get('has_seats') in ('1', 'true'):
+        rooms = rooms.filter(player_count__lt=F('max_player'))
+    cursor = _int_param(request, 'cursor')
+    if cursor is not None:
+        rooms = rooms.filter(id__lt=cursor) if descending else rooms.filter(id__gt=cursor)
+    rooms = rooms.order_by('-id' if descending else 'id').values('id', 'player_count', *fields)
+    limit = _int_param(request, 'limit')
+    if limit is None:
+        return [_without_id(r) for r in rooms], {}
+    limit = max(1, min(limit, 200))
+    page = list(rooms[:limit + 1])
+    next_cursor = page[limit - 1]['id'] if len(page) > limit else None
+    return [_without_id(r) for r in page[:limit]], {'next_cursor': next_cursor}
+
+def _without_id(row):
+    row.pop('id')
+    return row
+
 def list_rooms(request):
-    from .models import Room
-    rooms = list(Room.objects.filter(started=False))
-    deleted_room_ids = set()
-    for room in rooms:
-        clean_inactive_players(room, timeout_seconds=60)
-        if not Room.objects.filter(id=room.id).exists():
-            deleted_room_ids.add(room.id)
-    data = []
-    for r in rooms:
-        if r.id in deleted_room_ids:
-            continue
-        data.append({
-            'room_code': r.room_code,
-            'player_count': r.players.count(),
-            'max_player': r.max_player,
-        })
-    return JsonResponse({'rooms': data})
+    # 從 lobby 快取讀取，房間有變動時才會重算該房間
+    return lobby_response(request, get_lobby_directory().rooms())
+
+def lobby_response(request, rooms):
+    reaper.start()
+    if request.GET.get('has_seats') in ('1', 'true'):
+        rooms = [(room_id, r) for room_id, r in rooms if r['player_count'] < r['max_player']]
+    cursor = _int_param(request, 'cursor')
+    if cursor is not None:
+        rooms = [(room_id, r) for room_id, r in rooms if room_id > cursor]
+    limit = _int_param(request, 'limit')
+    if limit is None:
+        return FastJsonResponse({'rooms': [r for _, r in rooms]})
+    limit = max(1, min(limit, 200))
+    next_cursor = rooms[limit - 1][0] if len(rooms) > limit else None
+    return FastJsonResponse({'rooms': [r for _, r in rooms[:limit]], 'next_cursor': next_cursor})
 
 @csrf_exempt
 def admin_delete_room(request):
@@ -185,7 +429,9 @@ def admin_delete_room(request):
             admin_password = data.get('admin_password')
             if admin_password != settings.ADMIN_PASSWORD:
                 return JsonResponse({'status': 'error', 'message': '管理密碼錯誤'})
-            Room.objects.filter(room_code=room_code).delete()
+            for room_id in Room.objects.filter(room_code=room_code).values_list('id', flat=True):
+                Room.objects.filter(id=room_id).delete()
+                notify_room_deleted(room_id, room_code)
             return JsonResponse({'status': 'ok'})
         except Exception as e:
             return JsonResponse({'status': 'error', 'message': str(e)})
@@ -203,9 +449,9 @@ def kick_player(request):
             room = Room.objects.get(room_code=room_code)
             player = room.players.get(id=target_player_id)
 
-            from datetime import timedelta
-            from django.utils import timezone
-            is_idle = (timezone.now() - player.last_active) > timedelta(seconds=10)
+            # 與 get_players 顯示的離線判定相同
+            last_active = get_presence_store().last_active(player.id, player.last_active)
+            is_idle = (timezone.now() - last_active) > timedelta(seconds=IDLE_SECONDS)
 
             # 若玩家在線（非idle），必須是房主才能踢
             if not is_idle:
@@ -213,16 +459,24 @@ def kick_player(request):
                     return JsonResponse({'status': 'error', 'message': '只能由房主踢在線玩家'}, status=403)
 
             # 允許踢除
-            player.delete()
-
-            # 如果被踢的是房主，自動轉移房主
-            if room.owner_id == target_player_id:
-                new_owner = room.players.order_by('join_time').first()
-                if new_owner:
-                    room.owner = new_owner
-                    room.save()
-                else:
-                    room.delete()
+            player_id = player.id
+            get_presence_store().forget(player_id)
+            with transaction.atomic():
+                player.delete()
+
+                # 如果被踢的是房主，自動轉移房主
+                if room.owner_id == target_player_id:
+                    new_owner = room.players.order_by('join_time').first()
+                    if new_owner:
+                        room.owner = new_owner
+                        room.save(update_fields=['owner'])
+                    else:
+                        room_id = room.id
+                        room.delete()
+                        notify_room_deleted(room_id, room_code)
+                        return JsonResponse({'status': 'ok'})
+                notify_room_changed(room, 'kicked', player_count=room.players.count(),
+                                    player_id=player_id, owner_id=room.owner_id)
 
             return JsonResponse({'status': 'ok'})
 
@@ -243,7 +497,9 @@ def transfer_owner(request):
                 return JsonResponse({'status': 'error', 'message': '沒有權限'})
             new_owner = Player.objects.get(id=new_owner_id, room=room)
             room.owner = new_owner
-            room.save()
+            with transaction.atomic():
+                room.save(update_fields=['owner'])
+                notify_room_changed(room, 'owner_changed', owner_id=new_owner.id)
             return JsonResponse({'status': 'ok'})
         except Exception as e:
             return JsonResponse({'status': 'error', 'message': str(e)})
@@ -257,23 +513,63 @@ def admin_delete_all_rooms(request):
             admin_password = data.get('admin_password')
             if admin_password != settings.ADMIN_PASSWORD:
                 return JsonResponse({'status': 'error', 'message': '管理密碼錯誤'})
-            Room.objects.all().delete()
-            return JsonResponse({'status': 'ok', 'message': '所有房間已刪除'})
+            report = purge_rooms('all')
+            return JsonResponse({'status': 'ok', 'message': '所有房間已刪除', **report})
         except Exception as e:
             return JsonResponse({'status': 'error', 'message': str(e)})
     return JsonResponse({'status': 'error', 'message': 'Only POST allowed'})
 
+@csrf_exempt
+def admin_purge_rooms(request):
+    # 批次清除房間：body {admin_password, scope: all|idle|started, older_than_seconds}
+    #   idle：未開始且超過 older_than_seconds 沒有任何玩家心跳
+    #   started：已開始且超過 older_than_seconds 沒有換回合、也沒有任何房間事件
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Only POST allowed'})
+    try:
+        data = json.loads(request.body)
+        if data.get('admin_password') != settings.ADMIN_PASSWORD:
+            return JsonResponse({'status': 'error', 'message': '管理密碼錯誤'})
+        older_than = data.get('older_than_seconds')
+        report = purge_rooms(data.get('scope', 'all'), int(older_than) if older_than is not None else None)
+        return JsonResponse({'status': 'ok', **report})
+    except (TypeError, ValueError) as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+# 管理後台的列表可能很大，瀏覽器支援時以 gzip 壓縮
+@gzip_page
 def admin_list_rooms(request):
-    rooms = Room.objects.all().order_by('-id')
-    data = []
-    for r in rooms:
-        data.append({
-            'room_code': r.room_code,
-            'player_count': r.players.count(),
-            'max_player': r.max_player,
-            'started': r.started,
-        })
-    return JsonResponse({'rooms': data})
+    data, page = _room_page(request, Room.objects.all(), ['room_code', 'max_player', 'started'], descending=True)
+    return FastJsonResponse({'rooms': data, **page})
+
+@gzip_page
+def rooms_state(request):
+    # 一次取得多間房間的完整狀態（觀戰、管理後台用），固定兩次查詢（玩家只取需要的欄位）：
+    #   /rooms/state/?codes=abc,def   指定房間
+    #   /rooms/state/                 所有房間（可配合 ?limit=N&cursor=<next_cursor>）
+    rooms = Room.objects.all()
+    codes = request.GET.get('codes')
+    if codes:
+        rooms = rooms.filter(room_code__in=[c for c in codes.split(',') if c])
+    cursor = _int_param(request, 'cursor')
+    if cursor is not None:
+        rooms = rooms.filter(id__lt=cursor)
+    rooms = rooms.order_by('-id')
+    limit = _int_param(request, 'limit')
+    page = {}
+    if limit is not None:
+        limit = max(1, min(limit, 200))
+        rooms = list(rooms[:limit + 1])
+        page['next_cursor'] = rooms[limit - 1].id if len(rooms) > limit else None
+        rooms = rooms[:limit]
+    rooms = list(rooms)
+    rows = {room.id: [] for room in rooms}
+    if rows:
+        players = Player.objects.filter(room_id__in=rows).values_list('room_id', *PLAYER_FIELDS)
+        for room_id, *row in players:
+            rows[room_id].append(tuple(row))
+    states = [build_room_state(room, rows=rows[room.id]) for room in rooms]
+    return FastJsonResponse({'status': 'ok', 'rooms': states, **page})
 
 @csrf_exempt
 def set_room_settings(request):
@@ -287,7 +583,9 @@ def set_room_settings(request):
             if room.owner_id != owner_id:
                 return JsonResponse({'status': 'error', 'message': '只有房主可修改設定'})
             room.round_time = round_time
-            room.save()
+            with transaction.atomic():
+                room.save(update_fields=['round_time'])
+                notify_room_changed(room, 'settings_changed', round_time=round_time)
             return JsonResponse({'status': 'ok'})
         except Exception as e:
             return JsonResponse({'status': 'error', 'message': str(e)})
@@ -297,29 +595,26 @@ def set_room_settings(request):
 def player_heartbeat(request):
     if request.method == 'POST':
         data = json.loads(request.body)
-        player_id = data.get('player_id')
         try:
-            player = Player.objects.get(id=player_id)
-            player.last_active = timezone.now()
-            player.save(update_fields=['last_active'])
-            return JsonResponse({'status': 'ok'})
-        except Player.DoesNotExist:
+            player_id = int(data.get('player_id'))
+        except (TypeError, ValueError):
             return JsonResponse({'status': 'error', 'message': '玩家不存在'}, status=400)
+        # 只寫進 presence store，由 store 批次寫回 last_active；
+        # store 裡沒有這位玩家時（第一次心跳、過期或重啟）才查資料庫確認存在
+        presence = get_presence_store()
+        if not presence.is_known(player_id) and not Player.objects.filter(id=player_id).exists():
+            return JsonResponse({'status': 'error', 'message': '玩家不存在'}, status=400)
+        presence.touch(player_id)
+        return JsonResponse({'status': 'ok'})
 
-def clean_inactive_players(room, timeout_seconds=10):
-    if room.started:
-        return
-    timeout = timezone.now() - timedelta(seconds=timeout_seconds)
-    inactive_players = list(room.players.filter(last_active__lt=timeout))
-    for player in inactive_players:
-        player_id = player.id
-        player.delete()
-        if room.owner_id == player_id:
-            remaining_players = room.players.all().order_by('join_time')
-            if remaining_players.exists():
-                room.owner = remaining_players.first()
-                room.save()
-            else:
-                room.delete()
-                return
-
+def server_time(request):
+    # 讓前端估計與伺服器的時間差：offset ≈ server_time_ms - (送出時間 + 收到時間) / 2
+    response = JsonResponse({'server_time_ms': int(time.time() * 1000)})
+    response['Cache-Control'] = 'no-store'
+    return response
+
+def metrics_view(request):
+    # Prometheus 抓取用，統計只涵蓋本行程；不對外公開（見 settings.METRICS）
+    if not metrics.scrape_allowed(request):
+        return JsonResponse({'status': 'error', 'message': '沒有權限'}, status=403)
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')